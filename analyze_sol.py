@@ -9,7 +9,6 @@ from tqdm import tqdm
 from collections import defaultdict
 import yaml
 import re
-import itertools
 from dataclasses import dataclass
 from matching_data import get_data
 import logging
@@ -28,88 +27,93 @@ class ParsedSolution:
     full_cycles: list
 
 def get_violation_records(distance_df, solution_df):
-    
-    d0_constraint_violations = 0
-    d1_constraint_violations = 0
-    violation_records = []
-
-    for paper, group in solution_df.query('role != "AC"').groupby('paper'):
-        try:
-            rids = group['reviewer'].unique()
-        except KeyError:
-            rids = group['rid'].unique()
-        for (a,b) in itertools.combinations(rids, 2):
-            (a,b) = sorted((a,b))
-            try:
-                distance = distance_df.loc[(a,b)]['distance'].item()
-            except KeyError:
-                continue
-
-            violation_records.append(
-                    dict(reviewer_1=a, reviewer_2=b, paper=paper, d=distance)
-                )
-
-    df = pd.DataFrame.from_records(violation_records,columns=['reviewer_1', 'reviewer_2', 'paper', 'd']).drop_duplicates()
+    # Reviewer pairs (reviewer_1 < reviewer_2, no ACs) assigned to the same paper that are within a co-author
+    # distance: a self-join of the assignment on paper, then an inner join with the distance table
+
+    rid = 'reviewer' if 'reviewer' in solution_df.columns else 'rid'
+    assigned = solution_df.query('role != "AC"')[['paper', rid]].drop_duplicates()
+    pairs = assigned.merge(assigned, on='paper', suffixes=('_1', '_2'))
+    pairs = pairs[pairs[f'{rid}_1'] < pairs[f'{rid}_2']]
+    pairs = pairs.rename(columns={f'{rid}_1': 'reviewer_1', f'{rid}_2': 'reviewer_2'})
+
+    distances = distance_df['distance'].reset_index()
+    df = pairs.merge(distances, on=['reviewer_1', 'reviewer_2'], how='inner').rename(columns={'distance': 'd'})
+    df = df[['reviewer_1', 'reviewer_2', 'paper', 'd']].drop_duplicates().sort_values(['paper', 'reviewer_1', 'reviewer_2'], ignore_index=True)
     logger.info(f"Found {len(df.query('d == 0').index)} violations of co-author distance 0 and {len(df.query('d == 1').index)} of co-author distance 1")
     return df
 
-        
+def join_assignment_info(assignments: pd.DataFrame, paper_reviewer_df: pd.DataFrame, reviewer_df: pd.DataFrame) -> pd.DataFrame:
+    # Adds score, role, seniority and region to (paper, reviewer) rows with one join per table
+    scores = paper_reviewer_df['score'].reset_index()
+    df = assignments.merge(scores, on=['paper', 'reviewer'], how='left')
+    df = df.join(reviewer_df[['role', 'seniority', 'region']], on='reviewer')
+    missing = df['score'].isna() | df['role'].isna()
+    if missing.any():
+        raise KeyError(f"Assigned pairs missing from the input data: {list(zip(df.paper[missing], df.reviewer[missing]))[:5]}")
+    return df
+
+REGION_VAR = re.compile(r'^region\d+$')
+CYCLE_CONSTRAINT = re.compile(r'^cycle_ip(\d+)_jp(\d+)_i(\d+)_j(\d+)$')
+
+def iter_solution_elements(solution_file: str):
+    # Streams the (tag, attrib) of every <variable> and <constraint> of a .sol file in one pass. Elements are
+    # removed from the tree once read, so memory stays bounded however large the file is.
+    parents = []
+    for event, element in et.iterparse(solution_file, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag in ('variable', 'constraint'):
+            yield element.tag, element.attrib
+            if len(parents) > 0:
+                parents[-1].remove(element)
+
 def parse_solution(solution_file: str, paper_reviewer_df: pd.DataFrame, reviewer_df: pd.DataFrame) -> ParsedSolution:
-    
-    tree = et.parse(solution_file)
 
     region_stats = False
     regions = []
     cycle_stats = False
     cycles = []
     full_cycles = []
-    records = []
+    assigned = []
 
     logger.info(f"Parsing solution")
-    root = tree.getroot()
-    for variables in root.iter('variables'):
-        for variable in variables.iter('variable'):
-            attrib = variable.attrib
-            name, value = attrib['name'], attrib['value']
-            # x_ij means reviewer j reviews paper i
-            # Small value in case cplex returns some stupid numbers close to 0
-            if name.startswith('x') and float(value) > 1e-5:
-                paper, reviewer = (int(x) for x in name.replace('x', '').split('_'))
-                score = paper_reviewer_df.loc[(paper, reviewer)]['score'].item()
-                r_info = reviewer_df.query(f'reviewer == {reviewer}')
-                record = dict(
-                    paper = paper,
-                    reviewer = reviewer,
-                    score = score,
-                    role = r_info['role'].item(),
-                    seniority = r_info['seniority'].item(),
-                    region = r_info['region'].item()
-                )
-                records.append(record)
-            elif re.match(r'^region\d+$', name):
-                region_stats = True
-                if float(value) > 1e-5:
-                    paper = int(name.replace('region', ''))
-                    regions.append(dict(
-                        paper=paper,
-                        regions=int(np.round(float(value)))
-                    ))
-            elif name.startswith('cycle'):
-                cycle_stats = True
-                if float(value) > 1e-5:
-                    paper1, paper2 = name.replace('cycle', '').split('_')
-                    cycles.append((int(paper1), int(paper2)))
-
-    for constraint in root.iter('constraint'):
-        n = constraint.attrib['name']
-        search = re.search(r'^cycle_ip(\d+)_jp(\d+)_i(\d+)_j(\d+)$', n)
-        if search:
-            pid1, rid1, pid2, rid2 = search.group(1), search.group(2), search.group(3), search.group(4)
-            full_cycles.append(tuple(map(int, (pid1, rid1, pid2, rid2))))
-
+    for tag, attrib in iter_solution_elements(solution_file):
+        if tag == 'constraint':
+            search = CYCLE_CONSTRAINT.search(attrib['name'])
+            if search:
+                full_cycles.append(tuple(map(int, search.groups())))
+            continue
+
+        name, value = attrib['name'], attrib['value']
+        # x_ij means reviewer j reviews paper i
+        # Small value in case cplex returns some stupid numbers close to 0
+        if name.startswith('x') and float(value) > 1e-5:
+            assigned.append(name)
+        elif REGION_VAR.match(name):
+            region_stats = True
+            if float(value) > 1e-5:
+                paper = int(name.replace('region', ''))
+                regions.append(dict(
+                    paper=paper,
+                    regions=int(np.round(float(value)))
+                ))
+        elif name.startswith('cycle'):
+            cycle_stats = True
+            if float(value) > 1e-5:
+                paper1, paper2 = name.replace('cycle', '').split('_')
+                cycles.append((int(paper1), int(paper2)))
+
+    # Names are x{paper}_{reviewer}
+    pairs = pd.Series(assigned, dtype=object).str[1:].str.split('_', expand=True)
+    assignments = pd.DataFrame({
+        'paper': pairs[0].astype(np.int64) if len(assigned) > 0 else np.array([], dtype=np.int64),
+        'reviewer': pairs[1].astype(np.int64) if len(assigned) > 0 else np.array([], dtype=np.int64),
+    })
 
     return ParsedSolution(
-        df = pd.DataFrame.from_records(records),
+        df = join_assignment_info(assignments, paper_reviewer_df, reviewer_df),
         region_stats = region_stats,
         region_df = pd.DataFrame.from_records(regions),
         cycle_stats = cycle_stats,
@@ -179,6 +183,28 @@ def parse_unassigned_papers(parsed_solution, per_paper_num_indicators, k=None, f
 
     return per_paper_num_indicators
     
+def solution_metrics(parsed_solution, violation_records_df, reviewer_df):
+    # Headline quality numbers of a solution (a subset of what analyse_solution logs), to compare runs
+    df = parsed_solution.df
+    pc_df = df.query('role == "PC"')
+    pc_min_scores = pc_df.groupby('paper')['score'].min()
+    metrics = {
+        'assigned_pairs': len(df),
+        'papers': df['paper'].nunique(),
+        'unassigned_reviewers': len(set(reviewer_df.index.values) - set(df['reviewer'].unique())),
+        'mean_score': df['score'].mean(),
+        'mean_paper_min_score_PC': pc_min_scores.mean(),
+        'papers_PC_score_le_0.15': int((pc_min_scores <= 0.15).sum()),
+        'mean_paper_max_seniority_PC': pc_df.groupby('paper')['seniority'].max().mean(),
+        'coauthor_violations_d0': int((violation_records_df['d'] == 0).sum()),
+        'coauthor_violations_d1': int((violation_records_df['d'] == 1).sum()),
+    }
+    if parsed_solution.region_stats and 'regions' in parsed_solution.region_df.columns:
+        metrics['papers_le_1_region'] = int((parsed_solution.region_df['regions'] <= 1).sum())
+    if parsed_solution.cycle_stats:
+        metrics['cycles'] = len(parsed_solution.cycles)
+    return metrics
+
 def analyse_solution(config, solution_file: str, matching_data=None):
 
     results_file = solution_file.replace('.sol', '_RESULTS.txt')
@@ -1,165 +1,775 @@
 import numpy as np
+import pandas as pd
+import sys
+import gzip
+import io
+import re
+from dataclasses import dataclass
+
+# Number of terms formatted at a time when writing, so that long rows are never joined into one string
+WRITE_CHUNK_TERMS = 10000
+# Row senses, stored as int8 codes into this list
+OPERS = ['<=', '>=', '=', '<', '>']
+# Decimals coefficients are rounded to in the LP file
+COEF_DECIMALS = 3
 
 class BaseILP:
     def __init__(self):
-        self.objective = Objective()
-        self.constraints = Constraints()
-        self.bounds = Bounds()
-        self.general = General()
-        self.binary = Binary()
-        
+        self.reset()
+
     def reset(self):
-        #easy hacky reset. ideally should delete the variables
-        self.objective = Objective()
-        self.constraints = Constraints()
-        self.bounds = Bounds()
-        self.general = General()
-        self.binary = Binary()
-
-    
-    def write_to_file(self,file_name):
-        with open(file_name,'w') as fh:
-            print(self.objective.to_string(),file=fh)
-            print(self.constraints.to_string(),file=fh)
-            print(self.bounds.to_string(),file=fh)
-            print(self.general.to_string(),file=fh)
-            print(self.binary.to_string(),file=fh)
-            print("End",file=fh)
-
-
-        
+        # The sections below are views over one compact model: integer variable ids into a shared name
+        # table, with rows stored as CSR arrays
+        self.vars = Variables()
+        self.objective = Objective(self.vars)
+        self.constraints = Constraints(self.vars)
+        self.bounds = Bounds(self.vars)
+        self.general = General(self.vars)
+        self.binary = Binary(self.vars)
+
+
+    def write_to_file(self,file_name,compress=None):
+        # Streams every section to the file a chunk of terms at a time, so the model is never held in memory
+        # as strings. Writes gzip-compressed LP if compress is set or file_name ends with .gz
+        if compress is None:
+            compress = file_name.endswith('.gz')
+        if compress:
+            fh = gzip.open(file_name,'wt',compresslevel=6)
+        else:
+            fh = open(file_name,'w',buffering=1 << 20)
+        with fh:
+            for section in [self.objective, self.constraints, self.bounds, self.general, self.binary]:
+                section.write(fh)
+                fh.write('\n')
+            fh.write('End\n')
+
+    def shrink(self):
+        # Release the growth slack of every array once the model is complete
+        for section in [self.objective, self.constraints, self.bounds, self.general, self.binary]:
+            for value in vars(section).values():
+                if isinstance(value, (GrowableArray, StringTable)):
+                    value.shrink()
+
+    def mark(self):
+        # Current size of every section. to_arrays(since=mark) then exports only what was added afterwards.
+        return ModelMark(vars=len(self.vars), objective=len(self.objective), constraints=len(self.constraints),
+                         bounds=len(self.bounds), general=len(self.general), binary=len(self.binary))
+
+    def to_arrays(self, since=None):
+        # The model as flat arrays for a solver's bulk API, with the defaults of the LP format: variables are
+        # continuous in [0, inf) unless bounded or declared general/binary. Coefficients are rounded to
+        # COEF_DECIMALS and terms repeated within a row are summed, as in the written and re-read LP file.
+        # With since (a ModelMark) only the variables and rows added after the mark are exported; objective
+        # terms, bounds and types added since then may only refer to those new variables.
+        since = since if since is not None else ModelMark()
+        col_start, n_vars = since.vars, len(self.vars) - since.vars
+
+        def new_ids(ids, section):
+            if len(ids) > 0 and ids.min() < col_start:
+                raise ValueError(f"{section} added since the mark refer to variables that existed before it")
+            return ids - col_start
+
+        objective = self.objective
+        obj_start = objective.indptr[since.objective]
+        obj = np.bincount(new_ids(objective.indices[obj_start:], 'Objective terms'),
+                          weights=np.round(objective.coefs(obj_start), COEF_DECIMALS), minlength=n_vars)
+
+        lb = np.zeros(n_vars)
+        ub = np.full(n_vars, np.inf)
+        bound_ids = new_ids(self.bounds.ids[since.bounds:], 'Bounds')
+        lower, upper = self.bounds.lower[since.bounds:], self.bounds.upper[since.bounds:]
+        lb[bound_ids[~np.isnan(lower)]] = lower[~np.isnan(lower)]
+        ub[bound_ids[~np.isnan(upper)]] = upper[~np.isnan(upper)]
+        types = np.full(n_vars, 'C')
+        types[new_ids(self.general.ids[since.general:], 'General declarations')] = 'I'
+        types[new_ids(self.binary.ids[since.binary:], 'Binary declarations')] = 'B'
+        binary = types == 'B'
+        lb[binary] = np.maximum(lb[binary], 0)
+        ub[binary] = np.minimum(ub[binary], 1)
+
+        constraints = self.constraints
+        indptr, indices, data = constraints.merged(decimals=COEF_DECIMALS, start_row=since.constraints)
+        return ModelArrays(obj=obj, lb=lb, ub=ub, types=types,
+                           indptr=indptr, indices=indices, data=data,
+                           senses=np.array(OPERS)[constraints.opers[since.constraints:]],
+                           rhs=constraints.rhs[since.constraints:].copy(),
+                           row_names=constraints.names[since.constraints:],
+                           col_start=col_start)
+
+    def nbytes(self):
+        # Approximate memory held by the model: arrays, name table and row names
+        sections = [self.objective, self.constraints, self.bounds, self.general, self.binary]
+        return self.vars.nbytes() + sum(section.nbytes() for section in sections)
+
+
+def format_number(x, decimals=None):
+    # Integral values are written without a trailing .0 (e.g. '3', not '3.0')
+    x = float(np.round(x, decimals)) if decimals is not None else float(x)
+    return int(x) if x.is_integer() else x
+
+def format_numbers(values, decimals=None, sign=False):
+    # Vectorised str(format_number(x, decimals)) over an array, as an object array of strings.
+    # With sign=True non-negative values get a leading '+', as '{:+}' does.
+    values = np.asarray(values, dtype=np.float64)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    out = values.astype(str).astype(object)
+    integral = np.isfinite(values) & (values == np.trunc(values))
+    exact = integral & (np.abs(values) < 2**53)
+    out[exact] = values[exact].astype(np.int64).astype(str)
+    for i in np.flatnonzero(integral & ~exact):
+        out[i] = str(int(values[i]))
+    if sign:
+        out[values >= 0] = '+' + out[values >= 0]
+    return out
+
+def format_terms(names, coefs):
+    # '{:+} {}' over aligned names and coefficients, rounded to 3 decimals
+    coefs = np.asarray(coefs, dtype=np.float64)
+    if len(coefs) > 0 and (coefs == 1).all():
+        return '+1 ' + ' +1 '.join(names)
+    return ' '.join((format_numbers(coefs, decimals=COEF_DECIMALS, sign=True) + ' ' + np.asarray(names, dtype=object)).tolist())
+
+def pair_names(prefix, first, second):
+    # Bulk version of '{prefix}{first}_{second}'.format(...) over aligned integer arrays
+    first = pd.Series(np.asarray(first)).astype(str)
+    second = pd.Series(np.asarray(second)).astype(str)
+    return (prefix + first + '_' + second).values
+
+def compact_ints(values):
+    # int32 copy of an integer array when its values fit, int64 otherwise
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+        return values.astype(np.int32)
+    return values
+
+def to_string(section):
+    fh = io.StringIO()
+    section.write(fh)
+    return fh.getvalue()
+
+
+@dataclass
+class ModelArrays:
+    # Solver-neutral export of a model, see BaseILP.to_arrays. The objective is maximised; row r has the terms
+    # indices[indptr[r]:indptr[r+1]] with coefficients data[indptr[r]:indptr[r+1]]
+    obj: np.ndarray
+    lb: np.ndarray
+    ub: np.ndarray
+    types: np.ndarray # 'C', 'I' or 'B' per variable
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    senses: np.ndarray # one of OPERS per row
+    rhs: np.ndarray
+    row_names: list
+    col_start: int = 0 # id of the first variable; obj, lb, ub and types are indexed from it
+
+
+@dataclass
+class ModelMark:
+    # Section sizes of a model at one point in time, see BaseILP.mark
+    vars: int = 0
+    objective: int = 0
+    constraints: int = 0
+    bounds: int = 0
+    general: int = 0
+    binary: int = 0
+
+
+class GrowableArray:
+    # Append-only NumPy buffer with amortised O(1) appends. values is a view of the filled part.
+    def __init__(self, dtype, capacity=1024):
+        self.buffer = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.buffer.dtype).ravel()
+        end = self.size + values.size
+        if end > self.buffer.size:
+            buffer = np.empty(max(end, self.buffer.size * 3 // 2), dtype=self.buffer.dtype)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size:end] = values
+        self.size = end
+
+    def append(self, value):
+        self.extend([value])
+
+    @property
+    def values(self):
+        return self.buffer[:self.size]
+
+    def nbytes(self):
+        return self.buffer.nbytes
+
+    def shrink(self):
+        # Drop the spare capacity once no more values will be appended
+        if self.buffer.size > self.size:
+            self.buffer = self.buffer[:self.size].copy()
+
+class StringTable:
+    # Append-only list of strings kept as one utf-8 buffer and offsets; strings are decoded on access
+    def __init__(self):
+        self._chars = GrowableArray(np.uint8)
+        self._offsets = GrowableArray(np.int64)
+        self._offsets.append(0)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('StringTable index out of range')
+        offsets = self._offsets.values
+        return self._chars.values[offsets[key]:offsets[key + 1]].tobytes().decode()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def extend(self, strings):
+        encoded = [x.encode() for x in strings]
+        lengths = np.fromiter((len(x) for x in encoded), dtype=np.int64, count=len(encoded))
+        self._chars.extend(np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        self._offsets.extend(self._offsets.values[-1] + np.cumsum(lengths))
+
+    def nbytes(self):
+        return self._chars.nbytes() + self._offsets.nbytes()
+
+    def shrink(self):
+        self._chars.shrink()
+        self._offsets.shrink()
+
+
+class NameList:
+    # Variables registered one name at a time
+    def __init__(self, start):
+        self.start = start
+        self.names = GrowableArray(object)
+
+    def __len__(self):
+        return len(self.names)
+
+    def names_of(self, local_ids):
+        return self.names.values[local_ids]
+
+    def nbytes(self):
+        return self.names.nbytes() + sum(sys.getsizeof(x) for x in self.names.values)
+
+class PairNames:
+    # Variables named '{prefix}{first}_{second}' for aligned integer arrays first and second. Names are
+    # only generated on demand, so a block costs two integers per variable instead of a string and a
+    # dict entry.
+    def __init__(self, start, prefix, first, second):
+        self.start = start
+        self.prefix = prefix
+        self.first = compact_ints(first)
+        self.second = compact_ints(second)
+        self.pattern = re.compile(r'^{}(-?\d+)_(-?\d+)$'.format(re.escape(prefix)))
+        self.sorted_keys = None
+        self.key_order = None
+
+    def __len__(self):
+        return len(self.first)
+
+    def names_of(self, local_ids):
+        return pair_names(self.prefix, self.first[local_ids], self.second[local_ids])
+
+    def nbytes(self):
+        lookup = sum(x.nbytes for x in [self.sorted_keys, self.key_order] if x is not None)
+        return self.first.nbytes + self.second.nbytes + lookup
+
+    @staticmethod
+    def pack(first, second):
+        return (np.asarray(first, dtype=np.int64) << 32) | (np.asarray(second, dtype=np.int64) & 0xFFFFFFFF)
+
+    def find(self, names):
+        # Local ids of the given names, -1 for names not in this block
+        local_ids = np.full(len(names), -1, dtype=np.int64)
+        matches = [(k, self.pattern.match(name)) for k, name in enumerate(names)]
+        matches = [(k, m) for k, m in matches if m is not None]
+        if len(matches) == 0:
+            return local_ids
+        if self.sorted_keys is None:
+            keys = self.pack(self.first, self.second)
+            # blocks are usually added in (first, second) order, in which case the order is not stored
+            if not (keys[1:] >= keys[:-1]).all():
+                self.key_order = compact_ints(np.argsort(keys, kind='stable'))
+                keys = keys[self.key_order]
+            self.sorted_keys = keys
+        positions = np.array([k for k, _ in matches])
+        keys = self.pack([int(m.group(1)) for _, m in matches], [int(m.group(2)) for _, m in matches])
+        found = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.sorted_keys) - 1)
+        hit = self.sorted_keys[found] == keys
+        local_ids[positions[hit]] = found[hit] if self.key_order is None else self.key_order[found[hit]]
+        return local_ids
+
+
+class Variables:
+    # Name table of the model. Variables get consecutive integer ids, in segments that are either
+    # NameLists or PairNames blocks.
+    def __init__(self):
+        self.segments = []
+        self.starts = []
+        self.ids = {} # name -> id, for NameList segments only
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        return sys.getsizeof(self.ids) + sum(segment.nbytes() for segment in self.segments)
+
+    def _add_segment(self, segment):
+        self.segments.append(segment)
+        self.starts.append(segment.start)
+
+    def add_pairs(self, prefix, first, second):
+        # Registers a block of '{prefix}{first}_{second}' variables and returns their ids. A block must be
+        # added before any of its names are referenced through get_ids.
+        segment = PairNames(self.size, prefix, first, second)
+        self._add_segment(segment)
+        self.size += len(segment)
+        return np.arange(segment.start, self.size, dtype=np.int32)
+
+    def get_ids(self, names):
+        # Ids of the given variable names, registering names not seen before
+        if isinstance(names, str):
+            names = [names]
+        ids = np.fromiter((self.ids.get(name, -1) for name in names), dtype=np.int64, count=len(names))
+        missing = np.flatnonzero(ids < 0)
+        for segment in self.segments:
+            if len(missing) == 0:
+                break
+            if isinstance(segment, PairNames):
+                local_ids = segment.find([names[k] for k in missing])
+                found = local_ids >= 0
+                ids[missing[found]] = segment.start + local_ids[found]
+                missing = missing[~found]
+        new_names = []
+        for k in missing:
+            name = names[k]
+            if name not in self.ids:
+                self.ids[name] = self.size + len(new_names)
+                new_names.append(name)
+            ids[k] = self.ids[name]
+        if len(new_names) > 0:
+            if len(self.segments) == 0 or not isinstance(self.segments[-1], NameList):
+                self._add_segment(NameList(self.size))
+            self.segments[-1].names.extend(np.array(new_names, dtype=object))
+            self.size += len(new_names)
+        return ids.astype(np.int32)
+
+    def names_of(self, ids):
+        # Names of the given ids, as an object array
+        ids = np.asarray(ids, dtype=np.int64)
+        names = np.empty(len(ids), dtype=object)
+        which = np.searchsorted(self.starts, ids, side='right') - 1
+        for s in np.unique(which):
+            mask = which == s
+            segment = self.segments[s]
+            names[mask] = segment.names_of(ids[mask] - segment.start)
+        return names
+
+    def iter_name_chunks(self, ids):
+        for start in range(0, len(ids), WRITE_CHUNK_TERMS):
+            yield self.names_of(ids[start:start + WRITE_CHUNK_TERMS])
+
+
 class Equation:
+    # Input format for single rows. Sections convert equations into their compact storage when added.
     def __init__(self,eqn_type,name,var_coefs,oper,rhs):
         self.eqn_type = eqn_type #obj, or cons
-        self.name = name # used in the LP file. 
+        self.name = name # used in the LP file.
         self.var_coefs = var_coefs # list of (variable name,coef) tuple
         self.oper = oper # operator in between . valid entries: = , >= , <=, > , <
         self.rhs = rhs #rhs. using default of 0.
-        
+
     def to_string(self):
-        #if self.eqn_type == 'obj':
-            
         if self.name != '' and self.eqn_type == 'cons':
             prefix = '{}: '.format(self.name)
-            #ans = '{}: {}'.format(self.name,lhs)
         else:
             prefix = ''
-            #ans = lhs
-        #
-        lhs = ' '.join([ '{:+} {}'.format(np.round_(x[1],decimals=3),x[0]) for x in self.var_coefs])
+        lhs = format_terms([x[0] for x in self.var_coefs], [x[1] for x in self.var_coefs])
         if self.eqn_type == 'obj':
             suffix = ''
         else:
-            suffix = ' {} {}'.format(self.oper,self.rhs)
-            
+            suffix = ' {} {}'.format(self.oper,format_number(self.rhs))
+
         return '{}{}{}'.format(prefix, lhs, suffix)
 
-    
-class Objective:
-    def __init__(self):
-        self.objectives = []
-    
-    def add(self,eqn):
-        if isinstance(eqn,list):
-            self.objectives.extend(eqn)
+
+# How the coefficients of a segment of terms are stored: one value for all terms, or an array of the
+# narrowest of these types that holds every coefficient exactly
+COEF_CONSTANT, COEF_INT8, COEF_FLOAT32, COEF_FLOAT64 = 0, 1, 2, 3
+COEF_DTYPES = {COEF_INT8: np.int8, COEF_FLOAT32: np.float32, COEF_FLOAT64: np.float64}
+
+def same_bits(a, b):
+    # Bitwise equality of float64 arrays, so -0.0 and 0.0 differ and NaN equals itself
+    return np.array_equal(np.asarray(a, dtype=np.float64).view(np.int64), np.asarray(b, dtype=np.float64).view(np.int64))
+
+class Rows:
+    # CSR storage of linear rows: the terms of row r are the variable ids indices[indptr[r]:indptr[r+1]]
+    # with coefficients data[indptr[r]:indptr[r+1]].
+    # Coefficients are stored per segment of consecutively added terms: a single value when the terms share
+    # it (e.g. the unit coefficients of capacity rows), else an int8, float32 or float64 array. data expands
+    # them to one float64 per term on demand.
+    def __init__(self, variables):
+        self.vars = variables
+        self._indptr = GrowableArray(np.int64)
+        self._indptr.append(0)
+        self._indices = GrowableArray(np.int32)
+        # first term, storage kind and value (the coefficient, or the offset of the segment in its data array)
+        self._segment_starts = GrowableArray(np.int64)
+        self._segment_kinds = GrowableArray(np.int8)
+        self._segment_values = GrowableArray(np.float64)
+        self._data8 = GrowableArray(np.int8)
+        self._data32 = GrowableArray(np.float32)
+        self._data64 = GrowableArray(np.float64)
+
+    def __len__(self):
+        return len(self._indptr) - 1
+
+    @property
+    def indptr(self):
+        return self._indptr.values
+
+    @property
+    def indices(self):
+        return self._indices.values
+
+    @property
+    def data(self):
+        return self.coefs()
+
+    def _coef_data(self, kind):
+        return {COEF_INT8: self._data8, COEF_FLOAT32: self._data32, COEF_FLOAT64: self._data64}[kind]
+
+    def coefs(self, start=0, end=None):
+        # float64 coefficients of the terms start to end
+        end = len(self._indices) if end is None else end
+        out = np.empty(end - start, dtype=np.float64)
+        starts = self._segment_starts.values
+        ends = np.append(starts[1:], len(self._indices))
+        first = max(int(np.searchsorted(starts, start, side='right')) - 1, 0)
+        for k in range(first, len(starts)):
+            if starts[k] >= end:
+                break
+            lo, hi = max(starts[k], start), min(ends[k], end)
+            kind, value = self._segment_kinds.values[k], self._segment_values.values[k]
+            if kind == COEF_CONSTANT:
+                out[lo - start:hi - start] = value
+            else:
+                offset = int(value) - starts[k]
+                out[lo - start:hi - start] = self._coef_data(kind).values[offset + lo:offset + hi]
+        return out
+
+    def nbytes(self):
+        arrays = [self._indptr, self._indices, self._segment_starts, self._segment_kinds, self._segment_values,
+                  self._data8, self._data32, self._data64]
+        return sum(array.nbytes() for array in arrays)
+
+    def _add_segment(self, start, coefs):
+        # Stores the coefficients of the terms from start on. A segment continues the previous one if it is
+        # stored the same way (and, for a single value, has the same one).
+        if len(coefs) == 0:
+            return
+        if same_bits(coefs, np.full(len(coefs), coefs[0])):
+            kind, value = COEF_CONSTANT, coefs[0]
         else:
-            self.objectives.append(eqn)
-        
-    def to_string(self):
-        if len(self.objectives) == 0:
-            return ''
-        
-        return 'MAXIMIZE\nobj: {}'.format(
-            '\n'.join([eqn.to_string() for eqn in self.objectives]))
-    
-    
-    
-class Constraints:
-    def __init__(self):
-        self.constraints = []
-        
+            for kind, dtype in COEF_DTYPES.items():
+                with np.errstate(invalid='ignore', over='ignore'):
+                    stored = coefs.astype(dtype)
+                if same_bits(stored, coefs):
+                    break
+            data = self._coef_data(kind)
+            value = len(data)
+            data.extend(stored)
+        kinds, values = self._segment_kinds.values, self._segment_values.values
+        if len(kinds) > 0 and kinds[-1] == kind and (kind != COEF_CONSTANT or same_bits(values[-1], value)):
+            return
+        self._segment_starts.append(start)
+        self._segment_kinds.append(kind)
+        self._segment_values.append(value)
+
+    def _add_terms(self, terms, coefs):
+        # terms: one array of variable ids per row. coefs: one coefficient array per row, or a scalar for all terms
+        lengths = np.fromiter((len(t) for t in terms), dtype=np.int64, count=len(terms))
+        start = len(self._indices)
+        self._indptr.extend(self._indptr.values[-1] + np.cumsum(lengths))
+        if len(terms) > 0:
+            self._indices.extend(np.concatenate(terms))
+        if np.isscalar(coefs):
+            self._add_segment(start, np.full(min(lengths.sum(), 1), coefs, dtype=np.float64))
+        elif len(coefs) > 0:
+            self._add_segment(start, np.concatenate(coefs).astype(np.float64))
+
+    def _equations_to_terms(self, eqns):
+        if len(eqns) == 0:
+            return [], []
+        names = [x[0] for eqn in eqns for x in eqn.var_coefs]
+        coefs = np.array([x[1] for eqn in eqns for x in eqn.var_coefs], dtype=np.float64)
+        ids = self.vars.get_ids(names)
+        lengths = np.cumsum([len(eqn.var_coefs) for eqn in eqns])[:-1]
+        return np.split(ids, lengths), np.split(coefs, lengths)
+
+    def merged(self, decimals=None, start_row=0):
+        # indptr, indices, data of the rows from start_row on, with repeated (row, variable) terms summed;
+        # terms end up sorted within rows
+        n_rows, n_vars = len(self) - start_row, max(len(self.vars), 1)
+        row_indptr = self.indptr[start_row:]
+        terms = slice(row_indptr[0], row_indptr[-1])
+        rows = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(row_indptr))
+        keys, inverse = np.unique(rows * n_vars + self.indices[terms], return_inverse=True)
+        coefs = self.coefs(terms.start, terms.stop)
+        weights = np.round(coefs, decimals) if decimals is not None else coefs
+        data = np.bincount(inverse, weights=weights, minlength=len(keys))
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_vars, minlength=n_rows), out=indptr[1:])
+        return indptr, (keys % n_vars).astype(np.int32), data
+
+    def iter_blocks(self):
+        # (first_row, last_row, start, end) blocks of about WRITE_CHUNK_TERMS terms: short rows are batched
+        # together, a row longer than that is split into several blocks of its own
+        indptr = self.indptr
+        r, n_rows = 0, len(self)
+        while r < n_rows:
+            row_start, row_end = indptr[r], indptr[r + 1]
+            if row_end - row_start > WRITE_CHUNK_TERMS:
+                for start in range(row_start, row_end, WRITE_CHUNK_TERMS):
+                    yield r, r + 1, start, min(start + WRITE_CHUNK_TERMS, row_end)
+                r += 1
+                continue
+            last = max(r + 1, int(np.searchsorted(indptr, row_start + WRITE_CHUNK_TERMS, side='right')) - 1)
+            last = min(last, n_rows)
+            yield r, last, row_start, indptr[last]
+            r = last
+
+    def write_rows(self, fh, header, prefix, suffix):
+        # Writes header followed by one line per row: prefix(r), the terms, suffix(r).
+        # Names and coefficients are formatted a block at a time; blocks whose coefficients are all 1
+        # (e.g. capacity rows) skip coefficient formatting and are joined with ' +1 ' directly.
+        fh.write(header)
+        indptr, indices = self.indptr, self.indices
+        for first, last, start, end in self.iter_blocks():
+            names = self.vars.names_of(indices[start:end])
+            coefs = self.coefs(start, end)
+            if (coefs == 1).all():
+                terms, joiner = names.tolist(), ' +1 '
+            else:
+                terms, joiner = (format_numbers(coefs, decimals=COEF_DECIMALS, sign=True) + ' ' + names.astype(object)).tolist(), ' '
+            for r in range(first, last):
+                row_start, row_end = max(indptr[r], start), min(indptr[r + 1], end)
+                if row_start == indptr[r]:
+                    if r > 0:
+                        fh.write('\n')
+                    fh.write(prefix(r))
+                else:
+                    fh.write(' ')
+                if joiner == ' +1 ' and row_end > row_start:
+                    fh.write('+1 ')
+                fh.write(joiner.join(terms[row_start - start:row_end - start]))
+                if row_end == indptr[r + 1]:
+                    fh.write(suffix(r))
+
+
+class Objective(Rows):
+    # Each added equation is kept as its own row (and written on its own line)
     def add(self,eqn):
-        if isinstance(eqn,list):
-            self.constraints.extend(eqn)
-        else:
-            self.constraints.append(eqn)
-        
+        eqns = eqn if isinstance(eqn,list) else [eqn]
+        terms, coefs = self._equations_to_terms(eqns)
+        self._add_terms(terms, coefs)
+
+    def add_rows(self, terms, coefs):
+        self._add_terms(terms, coefs)
+
+    def coefficients(self, decimals=None):
+        # Dense objective vector over all variables, summing repeated terms
+        weights = np.round(self.data, decimals) if decimals is not None else self.data
+        return np.bincount(self.indices, weights=weights, minlength=len(self.vars))
+
     def to_string(self):
-        if len(self.constraints) == 0:
-            return ''
-        
-        return '\nSUBJECT TO\n {}'.format('\n'.join([eqn.to_string() for eqn in self.constraints]))
-        
-        
-class General:
-    def __init__(self):
-        self.vars = []
-        
-    def add(self,var):
-        if isinstance(var,list):
-            self.vars.extend(var)
-        else:
-            self.vars.append(var)
-    
+        return to_string(self)
+
+    def write(self,fh):
+        if len(self) == 0:
+            return
+        self.write_rows(fh, 'MAXIMIZE\nobj: ', lambda r: '', lambda r: '')
+
+
+
+class Constraints(Rows):
+    def __init__(self, variables):
+        super().__init__(variables)
+        self.names = StringTable()
+        self._opers = GrowableArray(np.int8)
+        self._rhs = GrowableArray(np.float64)
+
+    @property
+    def opers(self):
+        return self._opers.values
+
+    @property
+    def rhs(self):
+        return self._rhs.values
+
+    def nbytes(self):
+        return super().nbytes() + self._opers.nbytes() + self._rhs.nbytes() + self.names.nbytes()
+
+    def add(self,eqn):
+        eqns = eqn if isinstance(eqn,list) else [eqn]
+        terms, coefs = self._equations_to_terms(eqns)
+        self._add_terms(terms, coefs)
+        self.names.extend([eqn.name for eqn in eqns])
+        self._opers.extend([OPERS.index(eqn.oper) for eqn in eqns])
+        self._rhs.extend([eqn.rhs for eqn in eqns])
+
+    def add_rows(self, names, terms, coefs, oper, rhs):
+        # Bulk version of add: one row per name. oper and rhs are a scalar for all rows or one value per row
+        self._add_terms(terms, coefs)
+        self.names.extend(names)
+        opers = [OPERS.index(oper)] * len(names) if isinstance(oper, str) else [OPERS.index(o) for o in oper]
+        self._opers.extend(opers)
+        self._rhs.extend(np.broadcast_to(np.asarray(rhs, dtype=np.float64), (len(names),)))
+
+    def row_prefix(self, r):
+        name = self.names[r]
+        return '{}: '.format(name) if name != '' else ''
+
+    def row_suffixes(self):
+        # ' {oper} {rhs}' for every row
+        return ' ' + np.array(OPERS, dtype=object)[self.opers] + ' ' + format_numbers(self.rhs)
+
     def to_string(self):
-        if len(self.vars) == 0:
-            return ''
-        
-        return '\nGENERAL\n{}'.format('\n'.join(self.vars))
-        
-class Binary:
-    def __init__(self):
-        self.vars = []
-        
+        return to_string(self)
+
+    def write(self,fh):
+        if len(self) == 0:
+            return
+        self.write_rows(fh, '\nSUBJECT TO\n ', self.row_prefix, self.row_suffixes().__getitem__)
+
+
+def write_lines(fh,header,lines):
+    # Writes header followed by the lines separated by new lines, without joining them into one string
+    fh.write(header)
+    first = True
+    for chunk in lines:
+        if len(chunk) == 0:
+            continue
+        if not first:
+            fh.write('\n')
+        fh.write('\n'.join(chunk))
+        first = False
+
+
+class VarList:
+    # List of variable ids, e.g. the variables declared general or binary
+    header = ''
+
+    def __init__(self, variables):
+        self.vars = variables
+        self._ids = GrowableArray(np.int32)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def ids(self):
+        return self._ids.values
+
+    def nbytes(self):
+        return self._ids.nbytes()
+
     def add(self,var):
-        if isinstance(var,list):
-            self.vars.extend(var)
-        else:
-            self.vars.append(var)
-    
+        self._ids.extend(self.vars.get_ids(var))
+
+    def add_ids(self,ids):
+        self._ids.extend(ids)
+
     def to_string(self):
-        if len(self.vars) == 0:
-            return ''
-        
-        return '\nBINARY\n{}'.format('\n'.join(self.vars)) # CC: Changed to have new lines between every var
-        
+        return to_string(self)
+
+    def write(self,fh):
+        if len(self) == 0:
+            return
+        write_lines(fh, self.header, self.vars.iter_name_chunks(self.ids))
+
+class General(VarList):
+    header = '\nGENERAL\n'
+
+class Binary(VarList):
+    header = '\nBINARY\n' # CC: Changed to have new lines between every var
+
 
 class Bounds:
-    def __init__(self):
-        self.vars = []
-        self.lower = []
-        self.upper = []
-   
+    # Bounds per variable id, None (no bound) is stored as NaN
+    def __init__(self, variables):
+        self.vars = variables
+        self._ids = GrowableArray(np.int32)
+        self._lower = GrowableArray(np.float64)
+        self._upper = GrowableArray(np.float64)
+
     def __len__(self):
-        return len(self.vars)
+        return len(self._ids)
+
+    @property
+    def ids(self):
+        return self._ids.values
+
+    @property
+    def lower(self):
+        return self._lower.values
+
+    @property
+    def upper(self):
+        return self._upper.values
+
+    def nbytes(self):
+        return self._ids.nbytes() + self._lower.nbytes() + self._upper.nbytes()
 
     def add(self,var,low = None,up = None):
         if isinstance(var,list):
-            self.vars.extend(var)
             if low is None:
                 low = [None]*len(var)
-            self.lower.extend(low)
             if up is None:
                 up = [None]*len(var)
-            self.upper.extend(up)
         else:
-            self.vars.append(var)
-            self.lower.append(low)
-            self.upper.append(up)
-        
-    def to_string(self):
-        if len(self.vars) == 0:
-            return ''
-        
-        bds = []
-        for (l,v,u) in zip(self.lower,self.vars,self.upper):
-            if l is None and u is None:
+            var, low, up = [var], [low], [up]
+        self.add_ids(self.vars.get_ids(var),
+                     [np.nan if l is None else l for l in low],
+                     [np.nan if u is None else u for u in up])
+
+    def add_ids(self,ids,low,up):
+        # low and up are a scalar for all variables or one value per variable, NaN for no bound
+        ids = np.asarray(ids)
+        self._ids.extend(ids)
+        self._lower.extend(np.broadcast_to(np.asarray(low, dtype=np.float64), ids.shape))
+        self._upper.extend(np.broadcast_to(np.asarray(up, dtype=np.float64), ids.shape))
+
+    def iter_bounds(self):
+        for start, names in zip(range(0, len(self), WRITE_CHUNK_TERMS), self.vars.iter_name_chunks(self.ids)):
+            lower, upper = self.lower[start:start + len(names)], self.upper[start:start + len(names)]
+            no_lower, no_upper = np.isnan(lower), np.isnan(upper)
+            if (no_lower & no_upper).any():
+                v = names[np.flatnonzero(no_lower & no_upper)[0]]
                 raise Exception("Both lower and upper bounds cannot be None. Var: {}".format(v))
-            if l is None:
-                bds.append('{} <= {}'.format(v,u))
-            elif u is None:
-                bds.append('{} <= {}'.format(l,v))
-            else:
-                bds.append('{} <= {} <= {}'.format(l,v,u))
-        return 'BOUNDS\n{}'.format('\n'.join(bds))
-    
+            # 'l <= v <= u', with the missing side dropped
+            lines = names.astype(object)
+            lines[~no_lower] = format_numbers(lower[~no_lower]) + ' <= ' + lines[~no_lower]
+            lines[~no_upper] = lines[~no_upper] + ' <= ' + format_numbers(upper[~no_upper])
+            yield lines.tolist()
+
+    def to_string(self):
+        return to_string(self)
+
+    def write(self,fh):
+        if len(self) == 0:
+            return
+        write_lines(fh, 'BOUNDS\n', self.iter_bounds())
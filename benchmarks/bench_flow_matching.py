@@ -0,0 +1,56 @@
+import argparse
+import logging
+import os
+import json
+import tempfile
+import time
+import pandas as pd
+from synthetic import make_matching_data, make_config
+from matching_ilp import MatchingILP
+from lp_solver import solve
+from flow_matching import solve_bmatching
+
+logger = logging.getLogger(__name__)
+
+def time_mip(data, config, problem_path, backend):
+    start = time.perf_counter()
+    ilp = MatchingILP(data.paper_reviewer_df, data.reviewer_df, data.distance_df, config, None, add_soft_constraints=False)
+    ilp.create_ilp(lp_filename=problem_path, write_lp=False)
+    solve(problem_path, model=ilp, backend=backend)
+    return time.perf_counter() - start
+
+def time_flow(data, config, prefix, backend):
+    start = time.perf_counter()
+    solve_bmatching(data.paper_reviewer_df, data.reviewer_df, data.distance_df, config, prefix, backend=backend)
+    return time.perf_counter() - start
+
+def objective(problem_path):
+    with open(problem_path.replace('.lp', '_status.json')) as f:
+        return json.load(f)['objective']
+
+def main(paper_counts, candidates_per_paper=50, backend='highs'):
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_papers in paper_counts:
+            logger.info(f'Solving the hard constraint matching for {n_papers} papers...')
+            data = make_matching_data(n_papers=n_papers, candidates_per_paper=candidates_per_paper)
+            config = make_config(sparsity_k=candidates_per_paper)
+            mip_path, flow_prefix = os.path.join(tmp, f'mip_{n_papers}.lp'), os.path.join(tmp, f'flow_{n_papers}')
+            mip = time_mip(data, config, mip_path, backend)
+            flow = time_flow(data, config, flow_prefix, backend)
+            records.append({'papers': n_papers, 'mip_sec': mip, 'flow_sec': flow, 'speedup': mip / flow,
+                            'mip_objective': objective(mip_path), 'flow_objective': objective(flow_prefix + '.lp')})
+    df = pd.DataFrame.from_records(records).set_index('papers')
+    print(f'Hard constraint matching: MIP vs. flow LP ({backend}), build and solve time in seconds')
+    print(df.round(3).to_string())
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paper_counts', type=int, nargs='+', default=[500, 1000, 2000])
+    parser.add_argument('--candidates_per_paper', type=int, default=50)
+    parser.add_argument('--backend', type=str, default='highs', choices=['cplex', 'highs'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    main(paper_counts=args.paper_counts, candidates_per_paper=args.candidates_per_paper, backend=args.backend)
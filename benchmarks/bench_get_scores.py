@@ -0,0 +1,34 @@
+import argparse
+import logging
+import time
+from synthetic import make_raw_scores, make_config
+from compute_scores import get_scores
+from legacy_scores import legacy_get_scores
+
+logger = logging.getLogger(__name__)
+
+def best_time(fn, config, scores, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        frame = scores.copy()
+        start = time.perf_counter()
+        fn(config, frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(n_rows, repeats=3):
+    config = make_config()
+    scores = make_raw_scores(n_rows=n_rows)
+    old_time = best_time(legacy_get_scores, config, scores, repeats)
+    new_time = best_time(get_scores, config, scores, repeats)
+    print(f'get_scores on {n_rows} rows (best of {repeats}): {old_time:.3f}s before, {new_time:.3f}s now, '
+          f'{old_time / new_time:.1f}x faster')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_rows', type=int, default=1000000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    main(n_rows=args.n_rows, repeats=args.repeats)
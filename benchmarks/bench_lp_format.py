@@ -0,0 +1,56 @@
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from synthetic import make_matching_data, make_config
+from bench_model_memory import build_model
+from base_ilp import to_string
+
+logger = logging.getLogger(__name__)
+
+def legacy_rows(section, names):
+    # Rows as the previous Equation held them: a list of (name, coef) tuples
+    indptr, coefs = section.indptr, section.data.tolist()
+    return [list(zip(names[indptr[r]:indptr[r + 1]], coefs[indptr[r]:indptr[r + 1]])) for r in range(len(section))]
+
+def legacy_format(rows):
+    # Previous Equation.to_string: one scalar np.round and '{:+}' per term
+    return '\n'.join([' '.join(['{:+} {}'.format(np.round(x[1], decimals=3), x[0]) for x in var_coefs]) for var_coefs in rows])
+
+def throughput(fn, arg, n_terms, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return n_terms / best
+
+def main(n_papers, candidates_per_paper=50, repeats=3):
+    data = make_matching_data(n_papers=n_papers, candidates_per_paper=candidates_per_paper)
+    config = make_config(sparsity_k=candidates_per_paper)
+    ilp = build_model(data, config, add_soft_constraints=False)
+
+    records = []
+    # objective: score coefficients; constraints: mostly unit-coefficient capacity rows
+    for name, section in [('objective', ilp.objective), ('constraints', ilp.constraints)]:
+        n_terms = len(section.indices)
+        rows = legacy_rows(section, ilp.vars.names_of(section.indices).tolist())
+        old = throughput(legacy_format, rows, n_terms, repeats)
+        new = throughput(to_string, section, n_terms, repeats)
+        records.append({'section': name, 'terms': n_terms, 'old_terms_per_sec': old,
+                        'new_terms_per_sec': new, 'speedup': new / old})
+    df = pd.DataFrame.from_records(records).set_index('section')
+    print(f'LP serialization throughput for {n_papers} papers (best of {repeats})')
+    print(df.round(1).to_string())
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_papers', type=int, default=2000)
+    parser.add_argument('--candidates_per_paper', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    main(n_papers=args.n_papers, candidates_per_paper=args.candidates_per_paper, repeats=args.repeats)
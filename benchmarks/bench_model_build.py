@@ -0,0 +1,60 @@
+import argparse
+import logging
+import time
+import pandas as pd
+from synthetic import make_matching_data, make_config
+from matching_ilp import MatchingILP
+
+logger = logging.getLogger(__name__)
+
+HARD_STAGES = [
+    ('objective', lambda ilp: ilp.add_reviewer_matching_objective()),
+    ('paper_capacity', lambda ilp: ilp.add_paper_capacity_constraints()),
+    ('reviewer_capacity', lambda ilp: ilp.add_reviewer_capacity_constraints()),
+]
+
+SOFT_STAGES = [
+    ('seniority', lambda ilp: ilp.add_seniority_reward()),
+    ('region', lambda ilp: (ilp.add_region_objective(), ilp.add_region_constraints_and_bounds())),
+    ('cycles', lambda ilp: (ilp.populate_bidding_cycles(), ilp.add_cycle_constraints(), ilp.add_cycle_objective())),
+    ('paper_distribution', lambda ilp: (ilp.add_paper_distribution_constraints_obj_limits(role='AC', num_papers_list=[20,30,40,50,60]),
+                                        ilp.add_paper_distribution_constraints_obj_limits(role='SPC', num_papers_list=[8,12,16,20,24]))),
+]
+
+def time_build(n_papers, candidates_per_paper, add_soft_constraints):
+    data = make_matching_data(n_papers=n_papers, candidates_per_paper=candidates_per_paper)
+    config = make_config(sparsity_k=candidates_per_paper)
+    ilp = MatchingILP(data.paper_reviewer_df, data.reviewer_df, data.distance_df, config, None,
+                      add_soft_constraints=add_soft_constraints)
+
+    stages = HARD_STAGES + (SOFT_STAGES if add_soft_constraints else [])
+    record = {'papers': n_papers, 'variables': len(data.paper_reviewer_df.index)}
+    start = time.perf_counter()
+    for name, stage in stages:
+        stage_start = time.perf_counter()
+        stage(ilp)
+        record[name] = time.perf_counter() - stage_start
+    record['total'] = time.perf_counter() - start
+    return record
+
+def main(paper_counts, candidates_per_paper=50, add_soft_constraints=False):
+    records = []
+    for n_papers in paper_counts:
+        logger.info(f'Building model for {n_papers} papers...')
+        records.append(time_build(n_papers, candidates_per_paper, add_soft_constraints))
+    df = pd.DataFrame.from_records(records).set_index('papers')
+    print('Model build time (seconds) by paper count')
+    print(df.round(3).to_string())
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paper_counts', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('--candidates_per_paper', type=int, default=50)
+    parser.add_argument('--add_soft_constraints', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    main(paper_counts=args.paper_counts,
+        candidates_per_paper=args.candidates_per_paper,
+        add_soft_constraints=args.add_soft_constraints)
@@ -0,0 +1,81 @@
+import argparse
+import logging
+import tracemalloc
+import gc
+import pandas as pd
+from synthetic import make_matching_data, make_config
+from bench_model_build import HARD_STAGES, SOFT_STAGES
+from matching_ilp import MatchingILP
+from base_ilp import Equation, OPERS
+
+logger = logging.getLogger(__name__)
+
+def build_model(data, config, add_soft_constraints):
+    ilp = MatchingILP(data.paper_reviewer_df, data.reviewer_df, data.distance_df, config, None,
+                      add_soft_constraints=add_soft_constraints)
+    for name, stage in HARD_STAGES + (SOFT_STAGES if add_soft_constraints else []):
+        stage(ilp)
+    ilp.shrink()
+    return ilp
+
+def to_equations(ilp):
+    # The model as the previous representation held it: one Equation with a list of (name, coef)
+    # tuples per row, every term with its own name string
+    def rows(section):
+        indptr = section.indptr
+        names = ilp.vars.names_of(section.indices)
+        coefs = section.data.tolist()
+        for r in range(len(section)):
+            yield r, [((name + ' ')[:-1], coef) for name, coef in zip(names[indptr[r]:indptr[r + 1]], coefs[indptr[r]:indptr[r + 1]])]
+
+    constraints = ilp.constraints
+    eqns = [Equation('obj', '', var_coefs, None, None) for _, var_coefs in rows(ilp.objective)]
+    eqns += [Equation('cons', constraints.names[r], var_coefs, OPERS[constraints.opers[r]], float(constraints.rhs[r]))
+             for r, var_coefs in rows(constraints)]
+    return eqns
+
+def traced(fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+def main(paper_counts, candidates_per_paper=50, add_soft_constraints=False):
+    records = []
+    for n_papers in paper_counts:
+        logger.info(f'Building model for {n_papers} papers...')
+        data = make_matching_data(n_papers=n_papers, candidates_per_paper=candidates_per_paper)
+        config = make_config(sparsity_k=candidates_per_paper)
+        ilp, compact, compact_peak = traced(build_model, data, config, add_soft_constraints)
+        eqns, legacy, _ = traced(to_equations, ilp)
+        nonzeros = len(ilp.objective.indices) + len(ilp.constraints.indices)
+        model = ilp.nbytes()
+        records.append({
+            'papers': n_papers,
+            'nonzeros': nonzeros,
+            'model_MB': model / 2**20,
+            'build_retained_MB': compact / 2**20,
+            'build_peak_MB': compact_peak / 2**20,
+            'equations_MB': legacy / 2**20,
+            'ratio': legacy / model,
+        })
+        del ilp, eqns
+    df = pd.DataFrame.from_records(records).set_index('papers')
+    # model_MB: the compact model itself. build_retained_MB additionally counts the MatchingILP's row indexes
+    print('Memory held by the built model: compact arrays vs. Equation objects with (name, coef) lists')
+    print(df.round(2).to_string())
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paper_counts', type=int, nargs='+', default=[1000, 2000, 4000])
+    parser.add_argument('--candidates_per_paper', type=int, default=50)
+    parser.add_argument('--add_soft_constraints', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    main(paper_counts=args.paper_counts,
+        candidates_per_paper=args.candidates_per_paper,
+        add_soft_constraints=args.add_soft_constraints)
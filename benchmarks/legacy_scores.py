@@ -0,0 +1,22 @@
+import pandas as pd
+
+def legacy_get_scores(config, scores):
+    # get_scores before it was vectorized: a merge for bid -> exponent, then one masked .loc assignment per rule
+    scores['is_positive'] = scores['bid'] >= config['POSITIVE_BID_THR']
+    bid2exponent = pd.DataFrame({'bid':[0.05,1,2,4,6],'exponent': config['HYPER_PARAMS']['bid_inverse_exponents']})
+    scores = scores.reset_index().merge(bid2exponent,how='left',on='bid').set_index(['paper','reviewer'])
+    epsilon = 0.0000001
+    scores['ms'] =  (scores['ntpms']  + scores['nacl'])/2
+    scores.loc[scores['ntpms'].isna(),'ms'] = scores['nacl'].loc[scores['ntpms'].isna()]
+    scores.loc[scores['nacl'].isna(),'ms'] = scores['ntpms'].loc[scores['nacl'].isna()]
+    scores['scores_base'] = (scores['ms'] + scores['nk'])/2
+    scores.loc[scores['ms'].isna(),'scores_base'] = scores['nk'].loc[scores['ms'].isna()]
+    scores.loc[scores['nk'].isna(),'scores_base'] = scores['ms'].loc[scores['nk'].isna()]
+    condn = scores['is_positive'] & (scores['nk'] < epsilon)
+    scores.loc[condn,'scores_base'] = scores['ms'].loc[condn]
+    scores.loc[scores['scores_base'].isna(),'scores_base'] = 0.0
+    scores['score']  = scores['scores_base']**(1.0/scores['exponent'])
+    lower_thr = 0.15
+    condn_ll = (scores['score'] <= lower_thr) & (~scores['nk'].isna())
+    scores.loc[condn_ll,'score'] = (scores['nk'].loc[condn_ll]**(1.0/scores['exponent'].loc[condn_ll])).clip(upper=lower_thr)
+    return scores
@@ -0,0 +1,97 @@
+import sys
+import os
+dir_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(dir_path))
+import numpy as np
+import pandas as pd
+from matching_data import MatchingData
+
+def make_matching_data(n_papers=1000, reviewers_per_paper=3, candidates_per_paper=50, n_regions=5, seed=0):
+    # In-memory stand-in for get_data(): a sparsified paper_reviewer_df with
+    # candidates_per_paper reviewers per paper, without touching any files
+    rng = np.random.default_rng(seed)
+    n_reviewers = max(n_papers * reviewers_per_paper, candidates_per_paper)
+    reviewers = np.arange(n_reviewers)
+
+    roles = np.where(reviewers % 10 == 0, 'AC', np.where(reviewers % 10 < 3, 'SPC', 'PC'))
+    reviewer_df = pd.DataFrame({
+        'reviewer': reviewers,
+        'role': roles,
+        'seniority': rng.integers(0, 4, n_reviewers),
+        'region': rng.integers(0, n_regions, n_reviewers).astype(str),
+    })
+    reviewer_df['region'] = 'Region' + reviewer_df['region']
+    reviewer_df['conflict_papers'] = [[] for _ in reviewers]
+    reviewer_df['authored'] = [rng.choice(n_papers, 1).tolist() for _ in reviewers]
+    reviewer_df['authored_any'] = True
+    reviewer_df = reviewer_df.set_index('reviewer')
+
+    papers = np.repeat(np.arange(n_papers), candidates_per_paper)
+    candidates = np.concatenate([rng.choice(n_reviewers, candidates_per_paper, replace=False) for _ in range(n_papers)])
+    paper_reviewer_df = pd.DataFrame({
+        'paper': papers,
+        'reviewer': candidates,
+        'score': rng.random(papers.size),
+        'role': roles[candidates],
+        'bid': rng.choice([0.05, 1, 2, 4, 6], papers.size),
+    }).set_index(['paper', 'reviewer'])
+
+    pairs = rng.choice(n_reviewers, (n_reviewers, 2))
+    pairs = np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1)
+    distance_df = pd.DataFrame({
+        'reviewer_1': pairs[:, 0],
+        'reviewer_2': pairs[:, 1],
+        'distance': rng.integers(0, 2, len(pairs)),
+    }).drop_duplicates(['reviewer_1', 'reviewer_2']).set_index(['reviewer_1', 'reviewer_2'])
+
+    return MatchingData(
+        reviewer_df=reviewer_df,
+        paper_reviewer_df=paper_reviewer_df,
+        distance_df=distance_df)
+
+def make_raw_scores(n_rows=1000000, nan_fraction=0.2, seed=0):
+    # Stand-in for the joined RAW_SCORES_FILE and BIDS_FILE that get_scores sees: ntpms, nacl and nk with
+    # missing values, exact zeros and negative normalized scores, and bids of the rubric
+    rng = np.random.default_rng(seed)
+    scores = pd.DataFrame({
+        'paper': rng.integers(0, max(n_rows // 100, 1), n_rows),
+        'reviewer': rng.integers(0, max(n_rows // 100, 1), n_rows),
+    })
+    for col in ['ntpms', 'nacl', 'nk']:
+        values = rng.normal(0.4, 0.3, n_rows)
+        values[rng.random(n_rows) < 0.05] = 0.0
+        values[rng.random(n_rows) < nan_fraction] = np.nan
+        scores[col] = values
+    scores['bid'] = rng.choice([0.05, 1, 2, 4, 6], n_rows)
+    return scores.set_index(['paper', 'reviewer'])
+
+def make_config(sparsity_k=50):
+    return {
+        'POSITIVE_BID_THR': 4,
+        'DEFAULT_BID_WHEN_NO_BIDS': 1,
+        'HYPER_PARAMS': {
+            'sparsity_k': sparsity_k,
+            'score_threshold': 0.15,
+            'max_reviews_per_paper_PC': 2,
+            'max_reviews_per_paper_SPC': 1,
+            'max_reviews_per_paper_AC': 1,
+            'max_papers_per_reviewer_PC': 3,
+            'max_papers_per_reviewer_SPC': 200,
+            'max_papers_per_reviewer_AC': 200,
+            'region_reward': 0.1,
+            'coreview_dis0_pen': -0.3,
+            'coreview_dis1_pen': -0.2,
+            'cycle_pen': -0.05,
+            'bid_inverse_exponents': [0.05, 1, 1.5, 2.5, 4],
+            'paper_distribution_pen': {
+                'AC': {20: -0.05, 30: -0.05, 40: -0.05, 50: -0.05, 60: -0.5},
+                'SPC': {8: -0.05, 12: -0.05, 16: -0.05, 20: -0.05, 24: -0.5},
+            },
+            'remove_non_symmetric': True,
+            'relax_paper_capacity': True,
+            'sen_reward': 0.1,
+            'min_seniority': 0,
+            'target_seniority': 5,
+            'include_d1': True,
+        },
+    }
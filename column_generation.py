@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import re
+import numpy as np
+import pandas as pd
+from base_ilp import COEF_DECIMALS
+from matching_ilp import MatchingILP, to_name
+from matching_data import filter_reviewers
+from create_indicator import pack_pairs
+from lp_solver import solve
+from analyze_sol import iter_solution_elements
+
+logger = logging.getLogger(__name__)
+
+# Pairs whose reduced cost exceeds this improve the LP relaxation
+REDUCED_COST_TOL = 1e-6
+MAX_ROUNDS = 50
+# Default cap on the pairs added per round, per paper of the sparse model, so the model stays compact
+COLUMNS_PER_PAPER = 4
+PAPER_CAPACITY = re.compile(r'^paper_capacity_([A-Z]+)_(-?\d+)$')
+REVIEWER_CAPACITY = re.compile(r'^reviewer_capacity_(-?\d+)_([A-Z]+)$')
+
+def read_capacity_duals(solution_file):
+    # Duals of the paper capacity rows, indexed by (paper, role), and of the reviewer capacity rows, indexed
+    # by reviewer, from the .sol file of an LP
+    if not os.path.exists(solution_file):
+        raise Exception(f"No solution written to {solution_file}. Is the matching infeasible?")
+    paper_keys, paper_duals, reviewer_keys, reviewer_duals = [], [], [], []
+    for tag, attrib in iter_solution_elements(solution_file):
+        if tag != 'constraint':
+            continue
+        if 'dual' not in attrib:
+            raise Exception(f"{solution_file} has no dual values. Was the relaxation solved as a MIP?")
+        match = PAPER_CAPACITY.match(attrib['name'])
+        if match:
+            paper_keys.append((int(match.group(2)), match.group(1)))
+            paper_duals.append(float(attrib['dual']))
+            continue
+        match = REVIEWER_CAPACITY.match(attrib['name'])
+        if match:
+            reviewer_keys.append(int(match.group(1)))
+            reviewer_duals.append(float(attrib['dual']))
+    paper_index = pd.MultiIndex.from_tuples(paper_keys, names=['paper', 'role']) if paper_keys else pd.MultiIndex.from_arrays([[], []], names=['paper', 'role'])
+    return (pd.Series(paper_duals, index=paper_index, dtype=np.float64),
+            pd.Series(reviewer_duals, index=pd.Index(reviewer_keys, name='reviewer'), dtype=np.float64))
+
+def price_columns(candidate_df, paper_reviewer_df, paper_duals, reviewer_duals):
+    # Candidate pairs that are not in paper_reviewer_df, and their reduced cost in the LP relaxation: the score
+    # minus the duals of the paper (for the reviewer's role) and reviewer capacity rows the pair would enter.
+    # A row that is not in the model yet has a dual of 0.
+    candidates = candidate_df.index
+    in_model = np.isin(pack_pairs(candidates.get_level_values('paper'), candidates.get_level_values('reviewer')),
+                       pack_pairs(paper_reviewer_df.index.get_level_values('paper'), paper_reviewer_df.index.get_level_values('reviewer')))
+    excluded = candidate_df[~in_model]
+
+    papers = excluded.index.get_level_values('paper').values
+    reviewers = excluded.index.get_level_values('reviewer').values
+    positions = paper_duals.index.get_indexer(pd.MultiIndex.from_arrays([papers, excluded['role'].values]))
+    paper_dual = np.where(positions >= 0, paper_duals.values[np.maximum(positions, 0)] if len(paper_duals) else 0.0, 0.0)
+    reviewer_dual = reviewer_duals.reindex(reviewers).fillna(0.0).values
+    # the model holds the scores rounded like every other coefficient
+    scores = np.round(excluded['score'].values, COEF_DECIMALS)
+    return excluded, scores - paper_dual - reviewer_dual
+
+def solve_relaxation(paper_reviewer_df, reviewer_df, distance_df, config, output_files_prefix, backend='cplex', fixed_variable_solution_file=None):
+    # LP relaxation of the hard constraint matching over the given pairs. Returns the .sol file (with duals)
+    # and the optimal objective.
+    problem_path = to_name(output_files_prefix)
+    ilp = MatchingILP(paper_reviewer_df, reviewer_df, distance_df, config, None,
+                      add_soft_constraints=False,
+                      fixed_variable_solution_file=fixed_variable_solution_file,
+                      output_files_prefix=output_files_prefix,
+                      relax_matching=True)
+    ilp.create_ilp(lp_filename=problem_path, write_lp=False)
+    solution_file = solve(problem_path, model=ilp, backend=backend)
+    with open(problem_path.replace('.lp', '_status.json')) as fh:
+        objective = json.load(fh)['objective']
+    return solution_file, objective
+
+def generate_columns(paper_reviewer_df, reviewer_df, distance_df, candidate_df, candidate_reviewer_df, config,
+                     output_files_prefix, backend='cplex', fixed_variable_solution_file=None,
+                     max_rounds=MAX_ROUNDS, max_columns_per_round=None):
+    # Grows the sparse set of (paper, reviewer) pairs by pricing: solve the LP relaxation of the hard
+    # constraint matching over the current pairs, add the candidate pairs with a positive reduced cost
+    # (at most max_columns_per_round, best first; by default COLUMNS_PER_PAPER per paper) and repeat. Once no
+    # pair prices out, the current pairs support an optimal solution of the matching over all candidate pairs,
+    # so sparsity_k can start small.
+    # Each round writes the files of {output_files_prefix}_colgen_{iteration}. Returns the grown
+    # (paper_reviewer_df, reviewer_df).
+    if max_columns_per_round is None:
+        max_columns_per_round = COLUMNS_PER_PAPER * paper_reviewer_df.index.get_level_values('paper').nunique()
+    for iteration in range(max_rounds):
+        solution_file, _ = solve_relaxation(paper_reviewer_df, reviewer_df, distance_df, config, f'{output_files_prefix}_colgen_{iteration}',
+                                            backend=backend, fixed_variable_solution_file=fixed_variable_solution_file)
+
+        paper_duals, reviewer_duals = read_capacity_duals(solution_file)
+        excluded, reduced_costs = price_columns(candidate_df, paper_reviewer_df, paper_duals, reviewer_duals)
+        improving = np.flatnonzero(reduced_costs > REDUCED_COST_TOL)
+        logger.info(f'Column generation round {iteration}: {len(improving)} of {len(excluded)} excluded pairs have a positive reduced cost')
+        if len(improving) == 0:
+            logger.info(f'No pair prices out. Stopping with {len(paper_reviewer_df)} pairs')
+            break
+        improving = improving[np.argsort(-reduced_costs[improving], kind='stable')[:max_columns_per_round]]
+        paper_reviewer_df = pd.concat([paper_reviewer_df, excluded.iloc[np.sort(improving)]])
+        reviewer_df = filter_reviewers(candidate_reviewer_df, paper_reviewer_df)
+    else:
+        logger.warning(f'Column generation stopped after {max_rounds} rounds with pairs still pricing out')
+    return paper_reviewer_df, reviewer_df
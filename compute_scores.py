@@ -1,62 +1,78 @@
+import numpy as np
 import pandas as pd
 import logging
+from data_cache import save_scores, scores_cache_dir
 
 logger = logging.getLogger(__name__)
 
+# Rows of RAW_SCORES_FILE read and scored at a time
+SCORES_CHUNK_ROWS = 2000000
+# Bids of the rubric (not willing, not entered, in a pinch, willing, eager), in the order of bid_inverse_exponents
+BID_RUBRIC = np.array([0.05, 1, 2, 4, 6])
+
 def get_scores(config, scores):
-    scores['is_positive'] = scores['bid'] >= config['POSITIVE_BID_THR']
-    bid2exponent = {'bid':[0.05,1,2,4,6],'exponent': config['HYPER_PARAMS']['bid_inverse_exponents']}
-    #[1/0.05, 1.0, 1.0/2, 1.0/4.0 , 1.0/6.0]}
-    bid2exponent = pd.DataFrame(bid2exponent)
-    scores = scores.reset_index().merge(bid2exponent,how='left',on='bid').set_index(['paper','reviewer'])
+    # One pass over the ntpms, nacl and nk columns: every masked overwrite of the formula is an np.where,
+    # applied in the same order, so the scores are bit-identical to applying them one by one. Returns a new
+    # frame with the score column on the index of scores, which is left unchanged.
+    ntpms, nacl, nk = (scores[col].values.astype(np.float64) for col in ['ntpms', 'nacl', 'nk'])
+    bid = scores['bid'].values
+    is_positive = bid >= config['POSITIVE_BID_THR']
+
+    # bid -> exponent, NaN for bids off the rubric
+    exponents = np.asarray(config['HYPER_PARAMS']['bid_inverse_exponents'], dtype=np.float64)
+    pos = np.minimum(np.searchsorted(BID_RUBRIC, bid), len(BID_RUBRIC) - 1)
+    exponent = np.where(BID_RUBRIC[pos] == bid, exponents[pos], np.nan)
     epsilon = 0.0000001
-    
-    #match score: avg of ntpms and nacl
-    scores['ms'] =  (scores['ntpms']  + scores['nacl'])/2 
-    #if ntpms is na, then overwrite by nacl
-    scores.loc[scores['ntpms'].isna(),'ms'] = scores['nacl'].loc[scores['ntpms'].isna()]
-    #if nacl is na, overwrite by ntpms
-    scores.loc[scores['nacl'].isna(),'ms'] = scores['ntpms'].loc[scores['nacl'].isna()]
-
-    #agg score: avg of match score and keyword score
-    scores['scores_base'] = (scores['ms'] + scores['nk'])/2
-    #if match score is na, overwrite by keyword score
-    scores.loc[scores['ms'].isna(),'scores_base'] = scores['nk'].loc[scores['ms'].isna()]
-    #if keyword score is na, overwrite by match score
-    scores.loc[scores['nk'].isna(),'scores_base'] = scores['ms'].loc[scores['nk'].isna()]
-    
-    # tweaking based on bid value
-    condn = scores['is_positive'] & (scores['nk'] < epsilon)
-    #if bid is positive and keyword score < epsilon, overwrite by match score
-    scores.loc[condn,'scores_base'] = scores['ms'].loc[condn]
-    
-    #if everything is na, score = 0
-    scores.loc[scores['scores_base'].isna(),'scores_base'] = 0.0
-    #
-    scores['score']  = scores['scores_base']**(1.0/scores['exponent'])
-    
-    # if score is below this thr, then backoff to keyword score only
-    lower_thr = 0.15
-    #select all scores less than 0.15
-    condn_ll = (scores['score'] <= lower_thr) & (~scores['nk'].isna())
-    #recompute them as ((nk)^(1/exponent)).clip(upper=0.15)
-    scores.loc[condn_ll,'score'] = (scores['nk'].loc[condn_ll]**(1.0/scores['exponent'].loc[condn_ll])).clip(upper=lower_thr)
-    return scores
 
-def compute_scores(config=None):
+    # pandas silences the invalid/divide warnings of the masked formula, so does the kernel
+    with np.errstate(invalid='ignore', divide='ignore'):
+        #match score: avg of ntpms and nacl; if either is na, the other one
+        ms = np.where(np.isnan(nacl), ntpms, np.where(np.isnan(ntpms), nacl, (ntpms + nacl)/2))
+        #agg score: avg of match score and keyword score; if either is na, the other one
+        scores_base = np.where(np.isnan(nk), ms, np.where(np.isnan(ms), nk, (ms + nk)/2))
+        #if bid is positive and keyword score < epsilon, overwrite by match score
+        scores_base = np.where(is_positive & (nk < epsilon), ms, scores_base)
+        #if everything is na, score = 0
+        scores_base = np.where(np.isnan(scores_base), 0.0, scores_base)
+        score = scores_base**(1.0/exponent)
+
+        # if score is below this thr, then backoff to keyword score only, as ((nk)^(1/exponent)).clip(upper=0.15)
+        lower_thr = 0.15
+        condn_ll = (score <= lower_thr) & ~np.isnan(nk)
+        score = np.where(condn_ll, np.minimum(nk**(1.0/exponent), lower_thr), score)
 
-    scores = pd.read_csv(config['RAW_SCORES_FILE']).set_index(['paper','reviewer'])
-    bids = pd.read_csv(config['BIDS_FILE']).set_index(['paper','reviewer'])
-    scores = scores.join(bids)
-    scores['bid'] = scores['bid'].fillna(config['DEFAULT_BID_WHEN_NO_BIDS'])
+    return pd.DataFrame({'score': score}, index=scores.index)
 
-    scores = get_scores(config,scores)
-    scores = scores[['score']]
-    num_entries_before = scores.size
-    scores = scores.query('score > 0')
-    num_entries_after = scores.size
+def compute_scores(config=None, cache_key=None, chunk_rows=SCORES_CHUNK_ROWS):
+    # Streams RAW_SCORES_FILE in blocks of chunk_rows, so memory is bounded by the block size and the
+    # (filtered) output rather than by the full papers x reviewers score matrix
+    bids = pd.read_csv(config['BIDS_FILE']).set_index(['paper','reviewer'])['bid']
+    # the lookup needs one bid per pair: of repeated (paper, reviewer) rows the last one counts
+    duplicated = bids.index.duplicated(keep='last')
+    if duplicated.any():
+        logger.warning(f"{duplicated.sum()} repeated (paper, reviewer) pairs in {config['BIDS_FILE']}, keeping the last bid of each")
+        bids = bids[~duplicated]
+
+    num_entries_before = 0
+    papers, reviewers, values = [], [], []
+    for chunk in pd.read_csv(config['RAW_SCORES_FILE'], chunksize=chunk_rows):
+        chunk = chunk.set_index(['paper','reviewer'])
+        positions = bids.index.get_indexer(chunk.index)
+        chunk['bid'] = np.where(positions >= 0, bids.values[positions], np.nan)
+        chunk['bid'] = chunk['bid'].fillna(config['DEFAULT_BID_WHEN_NO_BIDS'])
+
+        score = get_scores(config, chunk)['score'].values
+        num_entries_before += len(chunk)
+        keep = score > 0
+        papers.append(chunk.index.get_level_values('paper').values[keep])
+        reviewers.append(chunk.index.get_level_values('reviewer').values[keep])
+        values.append(score[keep])
+        del chunk
+
+    index = pd.MultiIndex.from_arrays([np.concatenate(papers), np.concatenate(reviewers)], names=['paper','reviewer'])
+    scores = pd.DataFrame({'score': np.concatenate(values)}, index=index)
+    num_entries_after = len(scores)
     logger.info(f'Filtered scores <= 0. {(num_entries_before - num_entries_after) / num_entries_before} fraction removed ...')
-    logger.info(f"Caching aggregated score to {config['CACHED_SCORES_FILE']} to save time during next run. To recompute, delete this file and rerun this script.")
-    scores.to_csv(config['CACHED_SCORES_FILE'])
+    logger.info(f"Caching aggregated score to {scores_cache_dir(config)} to save time during next run. It is recomputed when the score or bid files change.")
+    save_scores(config, scores, key=cache_key)
     return scores
-
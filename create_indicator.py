@@ -1,5 +1,5 @@
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,6 +9,11 @@ ROLE_2_MULTIPLER= {
     'SPC': 5,
     'PC': 1,
 }
+ROLES = ['PC', 'SPC', 'AC']
+
+def pack_pairs(papers, reviewers):
+	# One int64 key per (paper, reviewer) pair
+	return (np.asarray(papers, dtype=np.int64) << 32) | (np.asarray(reviewers, dtype=np.int64) & 0xFFFFFFFF)
 
 def create_paper_reviewer_df(config=None,
 							scores_df=None, 
@@ -17,7 +22,10 @@ def create_paper_reviewer_df(config=None,
 							per_reviewer_num_indicators=None,
 							per_paper_num_indicators=None,
 							k=10,
-							score_threshold=0.15):
+							score_threshold=0.15,
+							return_candidates=False):
+	# With return_candidates, also returns every (paper, reviewer) pair that survived the threshold and the
+	# conflicts (the pool the sparsified pairs are picked from), in the same layout as paper_reviewer_df
 
 	# Filter out scores below threshold
 	logger.info(f'Filtering scores below threshold {score_threshold}')
@@ -33,67 +41,60 @@ def create_paper_reviewer_df(config=None,
 	papers = scores_df.index.unique('paper').values
 
 	if per_reviewer_num_indicators is None:
-		records = []
-		for reviewer in reviewers:
-			role = reviewer_df.loc[reviewer]['role']
-			records.append({'reviewer': reviewer, 'k': k * ROLE_2_MULTIPLER[role]})
-		per_reviewer_num_indicators = pd.DataFrame.from_records(records).set_index('reviewer')
+		reviewer_k = reviewer_df.loc[reviewers, 'role'].map(ROLE_2_MULTIPLER).values * k
+		per_reviewer_num_indicators = pd.DataFrame({'reviewer': reviewers, 'k': reviewer_k}).set_index('reviewer')
 
 	if per_paper_num_indicators is None:
-		records = []
-		for paper in papers:
-			records.append({'paper':paper,'PC_k':k,'SPC_k':k,'AC_k':k})
-		per_paper_num_indicators = pd.DataFrame.from_records(records).set_index('paper')
+		per_paper_num_indicators = pd.DataFrame({'paper': papers, 'PC_k': k, 'SPC_k': k, 'AC_k': k}).set_index('paper')
 
 	logger.info('Deleting (paper,reviewer) pairs that appear in conflicts...')
-	# Filter out conflicts
-	to_delete = []
-	for reviewer in tqdm(reviewers,desc='Getting conflict papers'):
-		to_delete += [(paper, reviewer) for paper in reviewer_df.loc[reviewer]['conflict_papers']]
+	# Filter out conflicts: anti-join of the pairs with the exploded conflict lists, on packed keys
+	conflicts = reviewer_df.loc[reviewers, 'conflict_papers'].explode().dropna()
+	conflict_keys = pack_pairs(conflicts.values.astype(np.int64), conflicts.index.values)
 
-	logger.info(f'Dropping {len(to_delete)} conflict pairs...')
-	# TODO: very slow!
-	scores_df = scores_df.drop(index=to_delete, errors='ignore') # Only existing labels are dropped
+	logger.info(f'Dropping {len(conflict_keys)} conflict pairs...')
+	pair_keys = pack_pairs(scores_df.index.get_level_values('paper').values, scores_df.index.get_level_values('reviewer').values)
+	scores_df = scores_df[~np.isin(pair_keys, conflict_keys)]
 
 	reviewers = scores_df.index.unique('reviewer').values
 	papers = scores_df.index.unique('paper').values
+	candidate_df = scores_df
 
 	# Sort dataframe by scores
 	logger.info('Sorting scores...')
 	scores_df = scores_df.sort_values(by=['score'],ascending=False)
-	# Set scores_df index to reviewer
-	scores_df = scores_df.reset_index().set_index('reviewer')
+	scores_df = scores_df.reset_index()
+	# rank of every pair among the pairs of its reviewer, and of its paper for the reviewer's role, in score order
+	reviewer_rank = scores_df.groupby('reviewer', sort=False).cumcount().values
+	paper_rank = scores_df.groupby(['paper', 'role'], sort=False).cumcount().values
+	reviewer_code = pd.Index(reviewers).get_indexer(scores_df['reviewer'])
+	paper_code = pd.Index(papers).get_indexer(scores_df['paper'])
+	role_code = scores_df['role'].map({role: i for i, role in enumerate(ROLES)}).values
 	dfs=[]
-	# Add k best papers per reviewer
-	missing_count = {'PC': 0, 'SPC':0, 'AC':0}
 
+	# Add k best papers per reviewer
 	logger.info(f"Adding best {k* ROLE_2_MULTIPLER['PC']}, {k* ROLE_2_MULTIPLER['SPC']}, {k* ROLE_2_MULTIPLER['AC']} papers for each PC, SPC, and AC reviewer respectively...")
-	for reviewer in tqdm(reviewers, desc='Adding best papers for reviewers'):
-		reviewer_k = per_reviewer_num_indicators.loc[reviewer, 'k']
-		role = reviewer_df.loc[reviewer]['role']
-		k_reviewers_to_add = scores_df.loc[reviewer].head(reviewer_k)
-		dfs.append(k_reviewers_to_add.reset_index())
-
-	for role in ["PC","SPC","AC"]:
-		logger.info(f'{missing_count[role]} {role} reviewers with no papers')
-
-	# Set scores_df index to paper
-	scores_df = scores_df.reset_index().set_index('paper')
-	# Add k best reviewers per paper
-	papers_to_delete=[]
-	missing_count = {'PC': 0, 'SPC':0, 'AC':0}
+	reviewer_k = per_reviewer_num_indicators.loc[reviewers, 'k'].values
+	keep = reviewer_rank < reviewer_k[reviewer_code]
+	# grouped by reviewer (in order of appearance), best first
+	order = np.argsort(reviewer_code[keep], kind='stable')
+	dfs.append(scores_df[keep].iloc[order])
+	has_papers = np.bincount(reviewer_code[keep], minlength=len(reviewers)) > 0
+	reviewer_roles = reviewer_df.loc[reviewers, 'role'].values
+	for role in ROLES:
+		logger.info(f'{np.sum(~has_papers & (reviewer_roles == role))} {role} reviewers with no papers')
+
+	# Add k best reviewers per paper and role
 	logger.info(f"Adding best {k} reviewers per paper...")
-	for paper in tqdm(papers,desc='Adding best reviewers for papers'):
-		paper_df = scores_df.loc[paper]
-		for role in ["PC","SPC","AC"]:
-			paper_k = per_paper_num_indicators.loc[paper][f'{role}_k']
-			k_reviewers_to_add = paper_df.query(f'role == "{role}"').head(paper_k)
-			if role =='PC' and len(k_reviewers_to_add) == 0:
-				papers_to_delete.append(paper)
-			if len(k_reviewers_to_add) == 0:
-				missing_count[role]+=1
-			dfs.append(k_reviewers_to_add.reset_index())
-	for role in ["PC","SPC","AC"]:
+	paper_k = per_paper_num_indicators.loc[papers, [f'{role}_k' for role in ROLES]].values
+	keep = paper_rank < paper_k[paper_code, role_code]
+	# grouped by paper (in order of appearance), then role, best first
+	order = np.lexsort((role_code[keep], paper_code[keep]))
+	dfs.append(scores_df[keep].iloc[order])
+	num_added = np.bincount(paper_code[keep] * len(ROLES) + role_code[keep], minlength=len(papers) * len(ROLES)).reshape(len(papers), len(ROLES))
+	missing_count = dict(zip(ROLES, (num_added == 0).sum(axis=0)))
+	papers_to_delete = papers[num_added[:, ROLES.index('PC')] == 0].tolist()
+	for role in ROLES:
 		logger.info(f'{missing_count[role]} papers with no {role} reviewers')
 
 	paper_reviewer_df = pd.concat(dfs)
@@ -106,7 +107,14 @@ def create_paper_reviewer_df(config=None,
 
 	# Add bids
 	logger.info('Adding bids...')
-	paper_reviewer_df = paper_reviewer_df.join(bids_df)
-	paper_reviewer_df['bid'] = paper_reviewer_df['bid'].fillna(config['DEFAULT_BID_WHEN_NO_BIDS'])
+	paper_reviewer_df = add_bids(config, paper_reviewer_df, bids_df)
+
+	if return_candidates:
+		candidate_df = candidate_df.drop(index=papers_to_delete, level='paper', errors='ignore')
+		return paper_reviewer_df, add_bids(config, candidate_df, bids_df)
+	return paper_reviewer_df
 
-	return paper_reviewer_df
\ No newline at end of file
+def add_bids(config, df, bids_df):
+	df = df.join(bids_df)
+	df['bid'] = df['bid'].fillna(config['DEFAULT_BID_WHEN_NO_BIDS'])
+	return df
\ No newline at end of file
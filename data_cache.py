@@ -0,0 +1,143 @@
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of a cache entry or the way scores are computed changes, so old entries are recomputed
+SCORES_CACHE_VERSION = 1
+HASH_CHUNK_BYTES = 1 << 24
+# Config entries, besides the raw score and bid files, that the aggregated scores depend on
+SCORES_CONFIG_KEYS = ['POSITIVE_BID_THR', 'DEFAULT_BID_WHEN_NO_BIDS']
+SCORES_HYPER_PARAMS = ['bid_inverse_exponents']
+
+# Cache of the whole data preparation stage (get_data): one pickled MatchingData per key, least recently used
+# entries evicted beyond DATA_CACHE_MAX_ENTRIES
+DATA_CACHE_VERSION = 1
+DEFAULT_DATA_CACHE_MAX_ENTRIES = 4
+DATA_INPUT_FILES = ['RAW_SCORES_FILE', 'BIDS_FILE', 'REVIEWERS_FILE', 'COAUTHOR_DISTANCE_FILE']
+DATA_HYPER_PARAMS = ['sparsity_k', 'score_threshold'] + SCORES_HYPER_PARAMS
+
+def file_digest(path):
+    # Memoized on size and modification time, so a file is read once per run however many keys include it
+    st = os.stat(path)
+    return _file_digest(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path, size, mtime_ns):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_BYTES), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_key(version, files, params):
+    # Hash of the contents of the input files and of the (json serializable) parameters
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps({'version': version, 'params': params}, sort_keys=True).encode())
+    for path in files:
+        h.update(file_digest(path).encode())
+    return h.hexdigest()
+
+def scores_cache_key(config):
+    params = {key: config[key] for key in SCORES_CONFIG_KEYS}
+    params.update({key: config['HYPER_PARAMS'][key] for key in SCORES_HYPER_PARAMS})
+    return cache_key(SCORES_CACHE_VERSION, [config['RAW_SCORES_FILE'], config['BIDS_FILE']], params)
+
+def scores_cache_dir(config):
+    # CACHED_SCORES_FILE names a directory of .npy columns (a trailing extension, e.g. of an old .csv cache, is dropped)
+    return os.path.splitext(config['CACHED_SCORES_FILE'])[0]
+
+def id_dtype(ids):
+    if len(ids) == 0 or (ids.min() >= np.iinfo(np.int32).min and ids.max() <= np.iinfo(np.int32).max):
+        return np.int32
+    return np.int64
+
+def save_scores(config, scores, key=None):
+    # Writes scores (indexed by paper, reviewer with a score column) as paper.npy, reviewer.npy and score.npy
+    # next to a meta.json holding the version and cache key. The entry is written to a temporary directory
+    # and moved into place, so an interrupted run never leaves a partial entry behind.
+    # An existing cache_dir is only replaced if it is a scores cache, never a directory of the user's (e.g.
+    # data/ for an old CACHED_SCORES_FILE of data.csv)
+    cache_dir = scores_cache_dir(config)
+    if os.path.exists(cache_dir) and not os.path.isfile(os.path.join(cache_dir, 'meta.json')):
+        raise Exception(f"{cache_dir} exists and is not a scores cache, set CACHED_SCORES_FILE to a new path")
+    key = key or scores_cache_key(config)
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + '.tmp', dir=parent)
+    try:
+        for level in ['paper', 'reviewer']:
+            ids = scores.index.get_level_values(level).values
+            np.save(os.path.join(tmp_dir, f'{level}.npy'), ids.astype(id_dtype(ids)))
+        np.save(os.path.join(tmp_dir, 'score.npy'), scores['score'].values.astype(np.float64))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as fh:
+            json.dump({'version': SCORES_CACHE_VERSION, 'key': key, 'rows': len(scores)}, fh)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.replace(tmp_dir, cache_dir)
+
+def load_scores(config, key=None):
+    # Cached scores for the current inputs, or None if there is no cache or it was built from other inputs
+    cache_dir = scores_cache_dir(config)
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    if not os.path.isfile(meta_file):
+        return None
+    with open(meta_file) as fh:
+        meta = json.load(fh)
+    key = key or scores_cache_key(config)
+    if meta.get('version') != SCORES_CACHE_VERSION or meta.get('key') != key:
+        logger.info(f"Cached scores in {cache_dir} are stale (inputs or version changed). Recomputing...")
+        return None
+    columns = {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r') for name in ['paper', 'reviewer', 'score']}
+    index = pd.MultiIndex.from_arrays([columns['paper'].astype(np.int64), columns['reviewer'].astype(np.int64)], names=['paper', 'reviewer'])
+    return pd.DataFrame({'score': np.array(columns['score'])}, index=index)
+
+def data_cache_dir(config):
+    return config.get('DATA_CACHE_DIR', os.path.join(os.path.dirname(config['CACHED_SCORES_FILE']), 'data_cache'))
+
+def frame_digest(df):
+    if df is None:
+        return None
+    return hashlib.blake2b(pd.util.hash_pandas_object(df).values.tobytes(), digest_size=16).hexdigest()
+
+def data_cache_key(config, per_reviewer_num_indicators=None, per_paper_num_indicators=None, keep_candidates=False):
+    params = {key: config[key] for key in SCORES_CONFIG_KEYS}
+    params.update({key: config['HYPER_PARAMS'][key] for key in DATA_HYPER_PARAMS})
+    params['per_reviewer_num_indicators'] = frame_digest(per_reviewer_num_indicators)
+    params['per_paper_num_indicators'] = frame_digest(per_paper_num_indicators)
+    if keep_candidates:
+        params['keep_candidates'] = True
+    return cache_key(DATA_CACHE_VERSION, [config[key] for key in DATA_INPUT_FILES], params)
+
+def load_matching_data(config, key):
+    # Cached MatchingData for key, or None. A hit marks the entry as most recently used.
+    path = os.path.join(data_cache_dir(config), f'{key}.pkl')
+    if not os.path.isfile(path):
+        return None
+    os.utime(path)
+    return pd.read_pickle(path)
+
+def save_matching_data(config, key, matching_data):
+    max_entries = config.get('DATA_CACHE_MAX_ENTRIES', DEFAULT_DATA_CACHE_MAX_ENTRIES)
+    if max_entries <= 0:
+        return
+    cache_dir = data_cache_dir(config)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{key}.pkl')
+    pd.to_pickle(matching_data, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    entries = sorted(glob.glob(os.path.join(cache_dir, '*.pkl')), key=os.path.getmtime, reverse=True)
+    for old in entries[max_entries:]:
+        logger.info(f"Evicting least recently used data cache entry {old}")
+        os.remove(old)
@@ -0,0 +1,91 @@
+import argparse
+import logging
+import os
+import yaml
+from matching_ilp import MatchingILP, to_name
+from matching_data import get_data
+from lp_solver import solve
+from analyze_sol import analyse_solution, iter_solution_elements
+
+logger = logging.getLogger(__name__)
+
+# Matching vars further than this from 0 or 1 make a solution fractional
+INTEGRALITY_TOL = 1e-6
+
+def check_integral(solution_file):
+    # Raises if any matching variable of the .sol file is fractional
+    if not os.path.exists(solution_file):
+        raise Exception(f"No solution written to {solution_file}. Is the matching infeasible?")
+    fractional = []
+    for tag, attrib in iter_solution_elements(solution_file):
+        if tag == 'variable':
+            name, value = attrib['name'], float(attrib['value'])
+            if name.startswith('x') and abs(value - round(value)) > INTEGRALITY_TOL:
+                fractional.append(name)
+    if len(fractional) > 0:
+        raise Exception(f"{len(fractional)} matching variables are fractional, e.g. {fractional[:5]}")
+
+def solve_bmatching(paper_reviewer_df, reviewer_df, distance_df, config, output_files_prefix, backend='cplex', fixed_variable_solution_file=None):
+    # Hard-constraint-only matching (paper capacity by role, reviewer capacity, fixed assignments) as a
+    # b-matching flow LP. Its constraint matrix is a bipartite incidence matrix, so the simplex vertex the
+    # solver returns is integral and equal to the ILP optimum, without any branching.
+    # Writes {output_files_prefix}.sol in the usual format and returns its path.
+    problem_path = to_name(output_files_prefix)
+    ilp = MatchingILP(paper_reviewer_df, reviewer_df, distance_df, config, None,
+                      add_soft_constraints=False,
+                      fixed_variable_solution_file=fixed_variable_solution_file,
+                      output_files_prefix=output_files_prefix,
+                      relax_matching=True)
+    ilp.create_ilp(lp_filename=problem_path, write_lp=False)
+    solution_file = solve(problem_path, model=ilp, backend=backend)
+    check_integral(solution_file)
+    return solution_file
+
+def write_mip_start(solution_file, mip_start_file):
+    # Copies the matching vars of a .sol file into a CPLEX MIP start (.mst); the other variables are left
+    # for the solver to complete
+    with open(mip_start_file, 'w') as fh:
+        fh.write('<?xml version = "1.0" standalone="yes"?>\n<CPLEXSolutions version="1.2">\n')
+        fh.write(' <CPLEXSolution version="1.2">\n  <header solutionName="flow"/>\n  <variables>\n')
+        for tag, attrib in iter_solution_elements(solution_file):
+            if tag == 'variable' and attrib['name'].startswith('x'):
+                fh.write('   <variable name="{}" value="{}"/>\n'.format(attrib['name'], round(float(attrib['value']))))
+        fh.write('  </variables>\n </CPLEXSolution>\n</CPLEXSolutions>\n')
+
+def generate_warm_start(paper_reviewer_df, reviewer_df, distance_df, config, output_files_prefix, backend='cplex', fixed_variable_solution_file=None):
+    # MIP start for the full model: the optimal assignment under the hard constraints only. The variables of
+    # the soft constraints are left for the solver to complete (or repair, should a soft constraint row
+    # rule the assignment out). Returns the path of {output_files_prefix}.mst
+    solution_file = solve_bmatching(paper_reviewer_df, reviewer_df, distance_df, config, output_files_prefix,
+                                    backend=backend, fixed_variable_solution_file=fixed_variable_solution_file)
+    mip_start_file = to_name(output_files_prefix).replace('.lp', '.mst')
+    write_mip_start(solution_file, mip_start_file)
+    return mip_start_file
+
+def main(output_files_prefix, config, backend='cplex', rebuild_scores_file=False, fixed_variable_solution_file=None):
+    matching_data = get_data(config=config, rebuild_scores_file=rebuild_scores_file)
+    solution_file = solve_bmatching(matching_data.paper_reviewer_df, matching_data.reviewer_df, matching_data.distance_df,
+                                    config, output_files_prefix, backend=backend,
+                                    fixed_variable_solution_file=fixed_variable_solution_file)
+    # Writes {output_files_prefix}_matching.csv
+    analyse_solution(config, solution_file, matching_data=matching_data)
+    return solution_file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_files_prefix', type=str, default='flow')
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--solver', type=str, default='cplex', choices=['cplex', 'highs'])
+    parser.add_argument('--rebuild_scores_file', action='store_true')
+    parser.add_argument('--fixed_variable_solution_file', type=str, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.config_file, 'rb') as fh:
+        config = yaml.load(fh,Loader=yaml.FullLoader)
+
+    main(output_files_prefix=args.output_files_prefix,
+        config=config,
+        backend=args.solver,
+        rebuild_scores_file=args.rebuild_scores_file,
+        fixed_variable_solution_file=args.fixed_variable_solution_file)
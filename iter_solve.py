@@ -1,6 +1,7 @@
 import pandas as pd
 import sys
 import argparse
+import dataclasses
 import numpy as np
 import xml.etree.ElementTree as et
 from tqdm import tqdm
@@ -9,7 +10,10 @@ import os
 import yaml
 import json
 from analyze_sol import parse_solution, ParsedSolution, parse_unassigned_papers, analyse_solution, get_violation_records
-from lp_solver import solve
+from lp_solver import solve, make_solver
+from flow_matching import solve_bmatching, generate_warm_start
+from column_generation import generate_columns
+from lazy_coreview import CoreviewSeparator
 from matching_ilp import to_name, MatchingILP
 from coreview_filter import get_coreview_vars
 from collections import defaultdict
@@ -23,6 +27,15 @@ CONFLICT_SUFFIX = '_CONFLICTS.csv'
 NUM_VARIABLE_INDICATORS_SUFFIX = '_per_paper_num_indicators.csv'
 NUM_REVIEWER_SUFFIX = '_reviewer_windows.csv'
 
+@dataclasses.dataclass
+class IterSolveResult:
+    iterations: int
+    solution_file: str
+    # the _status.json of the last iteration (objective, full_objective, solve time, status)
+    status: dict
+    parsed_solution: ParsedSolution
+    violation_df: pd.DataFrame
+
 def update_unused_reviewers(per_reviewer_num, reviewer_df, matching_df, k, filename=None):
     # Find unused reviewers and increment their k
     all_rids = set(reviewer_df.index.values)
@@ -40,7 +53,7 @@ def create_initial_per_reviewer_num(reviewer_df, k):
         'SPC': 5,
         'PC': 1,
     }
-    per_reviewer_num['window_end'] = per_reviewer_num['role'].map(role_2_multiplier) * k  - 1
+    per_reviewer_num['window_end'] = per_reviewer_num['role'].map(role_2_multiplier).astype(np.int64) * k  - 1
     return per_reviewer_num
 
 def setup_logging(filename):
@@ -73,13 +86,45 @@ def main(output_files_prefix='itertest',
         valid_reviewers_file=None,
         add_soft_constraints=True,
         no_iterate=False,
-        max_iter=1000000000):
+        max_iter=1000000000,
+        in_memory=False,
+        write_lp=False,
+        solver='cplex',
+        incremental=False,
+        flow=False,
+        warm_start_iter0=True,
+        column_generation=False,
+        max_columns_per_round=None,
+        lazy=False,
+        matching_data=None):
+    # in_memory hands each model to the solver directly instead of writing and re-reading the .lp file;
+    # write_lp then still writes the .lp, for debugging. incremental (implies in_memory) keeps the model and
+    # the solver alive between iterations and only appends the new coreview triples.
+    # warm_start_iter0 starts iteration 0 from the flow solution of the hard constraints, unless an
+    # initial_solution is given.
+    # flow solves the matching as a b-matching LP instead of a MIP; only possible without soft constraints
+    # column_generation grows the sparsified pairs by LP pricing over all candidate pairs before iteration 0,
+    # adding at most max_columns_per_round pairs per round (None: column_generation.COLUMNS_PER_PAPER per paper)
+    # lazy (implies in_memory) replaces the row generation iterations with a single solve, in which the
+    # coreview rows an incumbent violates are added as lazy constraints
+    # matching_data (from get_data) skips the data preparation, e.g. when a sweep shares it between runs
+    # Returns an IterSolveResult of the last iteration
+    in_memory = in_memory or incremental or lazy
+    if flow and add_soft_constraints:
+        raise ValueError("The flow matching only covers the hard constraints, run it without add_soft_constraints")
+    if lazy and (incremental or flow or not add_soft_constraints):
+        raise ValueError("lazy adds the coreview rows of the soft constraints in a single solve, run it with add_soft_constraints and without incremental or flow")
 
     setup_logging(output_files_prefix + '.log')
-    matching_data = get_data(config=config, rebuild_scores_file=rebuild_scores_file)
+    if matching_data is None:
+        matching_data = get_data(config=config, rebuild_scores_file=rebuild_scores_file, keep_candidates=column_generation)
+    elif column_generation and matching_data.candidate_df is None:
+        raise ValueError("column_generation needs matching_data prepared with get_data(keep_candidates=True)")
     paper_reviewer_df = matching_data.paper_reviewer_df
     reviewer_df = matching_data.reviewer_df
     distance_df = matching_data.distance_df
+    candidate_df = matching_data.candidate_df
+    candidate_reviewer_df = matching_data.candidate_reviewer_df
 
 
     if valid_reviewers_file:
@@ -89,11 +134,22 @@ def main(output_files_prefix='itertest',
         reviewer_df = reviewer_df.query('reviewer in @valid_reviewers')
         distance_df = distance_df.query('reviewer_1 in @valid_reviewers and reviewer_2 in @valid_reviewers')
         paper_reviewer_df = paper_reviewer_df.query('reviewer in @valid_reviewers')
+        if column_generation:
+            candidate_reviewer_df = candidate_reviewer_df.query('reviewer in @valid_reviewers')
+            candidate_df = candidate_df.query('reviewer in @valid_reviewers')
 
     if valid_papers_file:
         logger.info('Filtering by valid papers...')
         valid_papers = pd.read_csv(valid_papers_file)['paper'].values
         paper_reviewer_df = paper_reviewer_df.query('paper in @valid_papers')
+        if column_generation:
+            candidate_df = candidate_df.query('paper in @valid_papers')
+
+    if column_generation:
+        logger.info('Growing the sparsified pairs by column generation...')
+        paper_reviewer_df, reviewer_df = generate_columns(paper_reviewer_df, reviewer_df, distance_df, candidate_df, candidate_reviewer_df, config, output_files_prefix, backend=solver, fixed_variable_solution_file=fixed_variable_solution_file, max_columns_per_round=max_columns_per_round)
+        # the solutions are analysed against the grown pairs
+        matching_data = dataclasses.replace(matching_data, paper_reviewer_df=paper_reviewer_df, reviewer_df=reviewer_df)
 
 
 
@@ -140,7 +196,8 @@ def main(output_files_prefix='itertest',
 
     for j in reversed(range(1000)):
         search_path = gen_problem_path(j)
-        if os.path.exists(search_path):
+        # The yml is written with every problem, also when the .lp is not
+        if os.path.exists(search_path) or os.path.exists(gen_problem_path(j, suffix='.yml')):
             i = j
             found = True
             break
@@ -174,40 +231,75 @@ def main(output_files_prefix='itertest',
     if per_reviewer_num is None:
         per_reviewer_num = create_initial_per_reviewer_num(reviewer_df, config['HYPER_PARAMS']['sparsity_k'])
 
+    ilp = None
+    session = None
     while True:
         logger.info(f"Starting iteration {i}")
 
         # Step 1: Create ILP
         logger.info(f"Step 1: Problem generation")
         ilp_file = gen_problem_path(i)
-        if os.path.exists(ilp_file):
-            logger.info(f"Skipping problem generation since path exists {ilp_file}")
+        solution_file = ilp_file.replace('.lp', '.sol')
+        co_review_vars_to_use = existing_pairs|(d0_pairs|d1_pairs if config['HYPER_PARAMS']['include_d1'] else d0_pairs)
+        since = None
+        if flow:
+            logger.info("Solving the hard constraint matching as a flow LP")
+            if not os.path.exists(solution_file):
+                solution_file = solve_bmatching(paper_reviewer_df, reviewer_df, distance_df, config, gen_problem_name(i), backend=solver, fixed_variable_solution_file=fixed_variable_solution_file)
+        elif not lazy and (os.path.exists(ilp_file) or (in_memory and os.path.exists(solution_file))):
+            # In lazy mode the model is always rebuilt: an .lp file holds none of the coreview rows, which
+            # only the separator of a live model adds
+            logger.info(f"Skipping problem generation since path exists {ilp_file if os.path.exists(ilp_file) else solution_file}")
+            # A live model would no longer match the files of this iteration
+            ilp = None
+            if session is not None:
+                session.close()
+                session = None
+        elif incremental and ilp is not None:
+            logger.info(f"Appending new coreview triples to the model of iteration {i - 1}")
+            since = ilp.mark()
+            ilp.add_coreview_triples(co_review_vars_to_use)
+            ilp.write_outputs(ilp_file, write_lp=write_lp)
         else:
-            co_review_vars_to_use = existing_pairs|(d0_pairs|d1_pairs if config['HYPER_PARAMS']['include_d1'] else d0_pairs)
-
             logger.info(f"Writing out bad tuples of reviewer/reviewer/papers")
             # to_block = pd.DataFrame(list(co_review_vars_to_use), columns=['j', 'jp', 'pid'])
             # to_block.to_csv(gen_problem_path(i, suffix=CONFLICT_SUFFIX) , index=False)
 
-            ilp = MatchingILP(paper_reviewer_df,reviewer_df,distance_df,config,co_review_vars_to_use,output_files_prefix=output_files_prefix,add_soft_constraints=add_soft_constraints,fixed_variable_solution_file=fixed_variable_solution_file)
-            ilp.create_ilp(lp_filename=ilp_file)
+            ilp = MatchingILP(paper_reviewer_df,reviewer_df,distance_df,config,co_review_vars_to_use,output_files_prefix=output_files_prefix,add_soft_constraints=add_soft_constraints,fixed_variable_solution_file=fixed_variable_solution_file,lazy_coreview=lazy)
+            ilp.create_ilp(lp_filename=ilp_file, write_lp=write_lp or not in_memory)
 
         # Step 2 Solve ILP with warm start
         logger.info(f"Step 2: Solving problem")
-        solution_file = ilp_file.replace('.lp', '.sol')
-        if os.path.exists(solution_file):
+        if flow:
+            logger.info(f"Already solved by the flow LP: {solution_file}")
+        elif os.path.exists(solution_file):
             logger.info(f"Skipping problem solving since path exists: {solution_file}")
         else:
             if i == 0 and initial_solution is not None:
                 warm_start = initial_solution
-            elif i == 0:
+            elif i == 0 and warm_start_iter0:
+                logger.info("Generating a warm start from the hard constraint flow solution")
+                try:
+                    warm_start = generate_warm_start(paper_reviewer_df, reviewer_df, distance_df, config, gen_problem_name(i) + '_warm_start', backend=solver, fixed_variable_solution_file=fixed_variable_solution_file)
+                except Exception as e:
+                    logger.warning(f"Could not generate a warm start, starting cold: {e}")
+                    warm_start = None
+            elif i == 0 or since is not None:
+                # An appended model starts from the solver's own incumbent
                 warm_start = None
             else:
                 warm_start = gen_problem_path(i - 1, suffix='.sol')
             # TODO: paramterize abstol
             logger.info(f'Abstol:{abstol}')
             logger.info(f'Relative MIP Gap:{relative_mip_gap}')
-            solution_file = solve(ilp_file, warm_start=warm_start,abstol=abstol, relative_mip_gap=relative_mip_gap)
+            if incremental and session is None:
+                session = make_solver(solver, abstol=abstol, relative_mip_gap=relative_mip_gap)
+            separator = CoreviewSeparator(ilp) if lazy else None
+            solution_file = solve(ilp_file, warm_start=warm_start,abstol=abstol, relative_mip_gap=relative_mip_gap, model=ilp if in_memory else None, backend=solver, solver=session, since=since, lazy_rows=separator)
+            if separator is not None:
+                separator.log_stats()
+        if not incremental:
+            ilp = None
         
         # Step 3: Analyze solution
         logger.info(f"Step 3: Parse and Analyze solution")
@@ -218,6 +310,11 @@ def main(output_files_prefix='itertest',
         violated_d0_pairs = list(violation_df.query('d == 0').drop('d',axis=1).itertuples(index=False))
         violated_d1_pairs = list(violation_df.query('d == 1').drop('d',axis=1).itertuples(index=False))
         logger.info(f'{len(violated_d0_pairs)} d0 and {len(violated_d1_pairs)} d1 coauthor constraints violated.')
+        if lazy:
+            # the lazy rows already penalized every violated triple of a penalized distance
+            d0_pairs |= set(violated_d0_pairs)
+            if config['HYPER_PARAMS']['include_d1']:
+                d1_pairs |= set(violated_d1_pairs)
 
         update_unused_reviewers(per_reviewer_num, reviewer_df, parsed_solution.df, config['HYPER_PARAMS']['sparsity_k'], filename=gen_problem_path(i, NUM_REVIEWER_SUFFIX))
         per_paper_num_indicators = parse_unassigned_papers(parsed_solution, per_paper_num_indicators, k=config['HYPER_PARAMS']['sparsity_k'], filename=gen_problem_path(i, NUM_VARIABLE_INDICATORS_SUFFIX))
@@ -256,6 +353,9 @@ def main(output_files_prefix='itertest',
         if not add_soft_constraints:
             logger.info(f'Soft constraints turned off. No row generation. Terminating...')
             break
+        if lazy:
+            logger.info(f'Coreview rows were added lazily during the solve. Terminating with {len(d0_pairs)} d0 and {len(d1_pairs)} d1 coauthor violations penalized')
+            break
         if no_iterate:
             logger.info('Iterating turned off. Terminating...')
             break
@@ -270,6 +370,11 @@ def main(output_files_prefix='itertest',
 
         i += 1
 
+    if session is not None:
+        session.close()
+
+    return IterSolveResult(iterations=i + 1, solution_file=solution_file, status=status_dict,
+                           parsed_solution=parsed_solution, violation_df=violation_df)
 
 
 if __name__ == '__main__':
@@ -290,8 +395,16 @@ if __name__ == '__main__':
     parser.add_argument('--num_coreview_vars', type=int, default=None)
     parser.add_argument('--master_conflicts_file', type=str, default=None)
     parser.add_argument('--initial_solution', type=str, default=None)
+    parser.add_argument('--no_warm_start', action='store_true', help='start iteration 0 cold instead of from the hard constraint flow solution')
     parser.add_argument('--no_iterate', action='store_true')
     parser.add_argument('--max_iter', type=int, default=10000000)
+    parser.add_argument('--in_memory', action='store_true', help='load each model into CPLEX from memory instead of through the .lp file')
+    parser.add_argument('--write_lp', action='store_true', help='with --in_memory, still write the .lp file for debugging')
+    parser.add_argument('--flow', action='store_true', help='without --add_soft_constraints, solve the matching as a flow LP instead of a MIP')
+    parser.add_argument('--incremental', action='store_true', help='keep the model and solver alive between iterations and only add new coreview triples (implies --in_memory)')
+    parser.add_argument('--lazy', action='store_true', help='add the violated coreview rows as lazy constraints in a single solve instead of iterating (implies --in_memory)')
+    parser.add_argument('--column_generation', action='store_true', help='grow the sparsified (paper, reviewer) pairs by LP reduced costs before iteration 0')
+    parser.add_argument('--max_columns_per_round', type=int, default=None, help='with --column_generation, the most pairs added per round, best priced first (default: 4 per paper)')
 
     #### Parameters ####
     parser.add_argument('--add_soft_constraints', action='store_true')
@@ -316,7 +429,8 @@ if __name__ == '__main__':
     # Paper distribution
     parser.add_argument('--no_paper_distribution_pen', action='store_true')
 
-    # CPLEX params
+    # Solver params
+    parser.add_argument('--solver', type=str, default='cplex', choices=['cplex', 'highs'])
     parser.add_argument('--abstol', type=float, default=None)
     parser.add_argument('--relative_mip_gap', type=float, default=None)
 
@@ -348,4 +462,13 @@ if __name__ == '__main__':
         valid_reviewers_file = args.valid_reviewers_file,
         add_soft_constraints=args.add_soft_constraints,
         no_iterate=args.no_iterate,
-        max_iter=args.max_iter)
+        max_iter=args.max_iter,
+        in_memory=args.in_memory,
+        write_lp=args.write_lp,
+        solver=args.solver,
+        incremental=args.incremental,
+        flow=args.flow,
+        warm_start_iter0=not args.no_warm_start,
+        column_generation=args.column_generation,
+        max_columns_per_round=args.max_columns_per_round,
+        lazy=args.lazy)
@@ -0,0 +1,41 @@
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Matching vars above this count as assigned; coreview vars below it as not (yet) penalized
+ASSIGNED_TOL = 0.5
+
+class CoreviewSeparator:
+    # Separation of the coreview rows for lazy constraint mode. Built from a MatchingILP created with
+    # lazy_coreview=True, whose lazy_triples index every candidate coreview triple by var id. Called with the
+    # var values of an incumbent, it returns the rows
+    #     coreview_{paper}_{reviewer_1}_{reviewer_2}:  coreview - x1 - x2 >= -1
+    # of the triples the incumbent assigns both reviewers of without setting their coreview var, as
+    # (names, ids, coefs, senses, rhs) for lp_solver.solve(lazy_rows=...). May be called from several solver
+    # threads at once.
+    def __init__(self, ilp):
+        if ilp.lazy_triples is None:
+            raise ValueError("The model has no lazy coreview triples. Was it built with lazy_coreview=True?")
+        triples = ilp.lazy_triples
+        self.papers = triples['paper'].values
+        self.reviewers = triples[['reviewer_1', 'reviewer_2']].values
+        self.ids = triples[['coreview_id', 'x_id_1', 'x_id_2']].values
+        self.lock = threading.Lock()
+        self.num_calls = 0
+        self.num_rows = 0
+
+    def __call__(self, values):
+        values = np.asarray(values)
+        coreview, first, second = self.ids[:, 0], self.ids[:, 1], self.ids[:, 2]
+        violated = np.flatnonzero((values[first] > ASSIGNED_TOL) & (values[second] > ASSIGNED_TOL) & (values[coreview] < ASSIGNED_TOL))
+        with self.lock:
+            self.num_calls += 1
+            self.num_rows += len(violated)
+        names = ['coreview_{}_{}_{}'.format(pid, rid_i, rid_j) for pid, (rid_i, rid_j) in zip(self.papers[violated], self.reviewers[violated])]
+        coefs = np.tile([1.0, -1.0, -1.0], (len(violated), 1))
+        return names, self.ids[violated], coefs, 'G' * len(violated), [-1.0] * len(violated)
+
+    def log_stats(self):
+        logger.info(f'Lazy coreview rows: {self.num_rows} rows added over {self.num_calls} incumbents')
@@ -1,67 +1,430 @@
-import cplex
+import abc
 import argparse
+import numpy as np
 import json
 import os
+import xml.etree.ElementTree as et
+from xml.sax.saxutils import quoteattr
 
 import time
 
+try:
+	import cplex
+except ImportError:
+	cplex = None
 
-def solve(problem_path=None, solution_file=None, warm_start=None, abstol=None, relative_mip_gap=None):
+try:
+	import highspy
+except ImportError:
+	highspy = None
+
+# Rows and columns passed to CPLEX per call when loading a model from memory
+LOAD_CHUNK_SIZE = 100000
+SENSE_CODES = {'<=': 'L', '>=': 'G', '=': 'E', '<': 'L', '>': 'G'}
+# Threads of every solver made by make_solver without an explicit count (None: the solver's default)
+default_threads = None
+
+
+class NoSolutionError(ValueError):
+	# The solver finished without a feasible solution to write
+	pass
+
+# Errors that solve() records as an infeasible run; any other error is a bug and propagates
+SOLVER_ERRORS = (NoSolutionError,) + ((cplex.exceptions.CplexError,) if cplex is not None else ())
+
+
+class SolverBackend(abc.ABC):
+	# A solver session: load a problem (from an LP file or a BaseILP in memory), optionally warm start it from
+	# a .sol file, solve, and write the solution in CPLEX's .sol format, which analyze_sol reads. A session can
+	# be kept alive to append rows and columns to the loaded model and solve again.
+	name = ''
+
+	@abc.abstractmethod
+	def open_log(self, log_file):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def set_tolerances(self, abstol=None, relative_mip_gap=None):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def set_threads(self, threads):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def read(self, problem_path):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def load_model(self, model, since=None):
+		# With since (a ModelMark of model) only the variables and rows added after it are appended to the
+		# loaded model, and the previous incumbent is kept as the start for the next solve
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def read_start(self, warm_start):
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def solve(self):
+		# Returns (status, status_string, objective); raises one of SOLVER_ERRORS if no solution was found
+		raise NotImplementedError
+
+	def set_lazy_rows(self, separator):
+		# separator(values) -> (names, ids, coefs, senses, rhs) of the rows that the var values of an incumbent
+		# violate. The solve then only accepts incumbents that violate no such row.
+		raise NotImplementedError(f"The {self.name} backend does not support lazy constraints")
+
+	@abc.abstractmethod
+	def write_solution(self, solution_file):
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+
+class LazyRowsCallback:
+	# CPLEX generic callback (candidate context): rejects every candidate incumbent with the rows the
+	# separator finds violated, which CPLEX enforces as lazy constraints
+	def __init__(self, separator):
+		self.separator = separator
+
+	def invoke(self, context):
+		if not context.in_candidate() or not context.is_candidate_point():
+			return
+		_, ids, coefs, senses, rhs = self.separator(context.get_candidate_point())
+		if len(rhs) > 0:
+			constraints = [cplex.SparsePair(ind=row_ids.tolist(), val=row_coefs.tolist()) for row_ids, row_coefs in zip(ids, coefs)]
+			context.reject_candidate(constraints=constraints, senses=senses, rhs=list(rhs))
+
+
+class CplexBackend(SolverBackend):
+	name = 'cplex'
+
+	def __init__(self):
+		if cplex is None:
+			raise ImportError("The cplex backend needs the cplex package")
+		self.cpx = cplex.Cplex()
+		self.log = None
+
+	def open_log(self, log_file):
+		if self.log is not None:
+			self.log.close()
+		self.log = open(log_file, 'w')
+		self.cpx.set_results_stream(self.log)
+		self.cpx.set_warning_stream(self.log)
+		self.cpx.set_error_stream(self.log)
+		self.cpx.set_log_stream(self.log)
+
+	def set_tolerances(self, abstol=None, relative_mip_gap=None):
+		if abstol is not None:
+			print(f'Setting abs mip tol to {abstol}')
+			self.cpx.parameters.mip.tolerances.absmipgap.set(abstol)
+		if relative_mip_gap:
+			print(f'Setting relative mip gap to {relative_mip_gap}')
+			self.cpx.parameters.mip.tolerances.mipgap.set(relative_mip_gap)
+
+	def set_threads(self, threads):
+		self.cpx.parameters.threads.set(threads)
+
+	def read(self, problem_path):
+		self.cpx.read(problem_path)
+
+	def load_model(self, model, since=None):
+		# Loads a BaseILP straight through the CPLEX array API instead of writing and reading an LP file.
+		# Variable and row names are the ones the LP file would use, so .sol files and warm starts are unchanged.
+		cpx = self.cpx
+		arrays = model.to_arrays(since=since)
+		incumbent = None
+		if since is None:
+			cpx.objective.set_sense(cpx.objective.sense.maximize)
+		elif cpx.solution.is_primal_feasible():
+			incumbent = cpx.solution.get_values()
+		lb = np.maximum(arrays.lb, -cplex.infinity)
+		ub = np.minimum(arrays.ub, cplex.infinity)
+		# Without integer variables the types are left out, so CPLEX keeps the problem an LP
+		types = arrays.types.tolist() if (arrays.types != 'C').any() else ''
+		n_vars = len(arrays.obj)
+		for start in range(0, n_vars, LOAD_CHUNK_SIZE):
+			end = min(start + LOAD_CHUNK_SIZE, n_vars)
+			cpx.variables.add(obj=arrays.obj[start:end].tolist(),
+							lb=lb[start:end].tolist(),
+							ub=ub[start:end].tolist(),
+							types=types[start:end],
+							names=model.vars.names_of(np.arange(arrays.col_start + start, arrays.col_start + end)).tolist())
+		n_rows = len(arrays.rhs)
+		indptr = arrays.indptr
+		for start in range(0, n_rows, LOAD_CHUNK_SIZE):
+			end = min(start + LOAD_CHUNK_SIZE, n_rows)
+			indices = arrays.indices[indptr[start]:indptr[end]].tolist()
+			data = arrays.data[indptr[start]:indptr[end]].tolist()
+			offsets = (indptr[start:end + 1] - indptr[start]).tolist()
+			lin_expr = [[indices[a:b], data[a:b]] for a, b in zip(offsets[:-1], offsets[1:])]
+			cpx.linear_constraints.add(lin_expr=lin_expr,
+									senses=[SENSE_CODES[x] for x in arrays.senses[start:end]],
+									rhs=arrays.rhs[start:end].tolist(),
+									names=arrays.row_names[start:end])
+		if incumbent is not None:
+			# New coreview variables are left to CPLEX to repair
+			cpx.MIP_starts.add(cplex.SparsePair(ind=list(range(len(incumbent))), val=incumbent),
+							cpx.MIP_starts.effort_level.repair)
+
+	def read_start(self, warm_start):
+		if warm_start.endswith('.mst'):
+			self.cpx.MIP_starts.read(warm_start)
+		else:
+			self.cpx.start.read_start(warm_start)
+
+	def solve(self):
+		self.cpx.solve()
+		status = self.cpx.solution.get_status()
+		status_string = self.cpx.solution.get_status_string()
+		obj = self.cpx.solution.get_objective_value()
+		return status, status_string, obj
+
+	def set_lazy_rows(self, separator):
+		self.cpx.set_callback(LazyRowsCallback(separator), cplex.callbacks.Context.id.candidate)
+
+	def write_solution(self, solution_file):
+		self.cpx.solution.write(solution_file)
+
+	def close(self):
+		self.cpx.end()
+		if self.log is not None:
+			self.log.close()
+
+
+class HighsBackend(SolverBackend):
+	# Open-source backend (pip install highspy). HiGHS reads CPLEX LP files; solutions are written in the
+	# CPLEX .sol layout so the rest of the pipeline does not depend on the solver.
+	name = 'highs'
+
+	def __init__(self):
+		if highspy is None:
+			raise ImportError("The highs backend needs the highspy package")
+		self.h = highspy.Highs()
+		self.h.setOptionValue('log_to_console', False)
+		self.lazy_rows = None
+
+	def open_log(self, log_file):
+		self.h.setOptionValue('log_file', log_file)
+
+	def set_tolerances(self, abstol=None, relative_mip_gap=None):
+		if abstol is not None:
+			print(f'Setting abs mip tol to {abstol}')
+			self.h.setOptionValue('mip_abs_gap', float(abstol))
+		if relative_mip_gap:
+			print(f'Setting relative mip gap to {relative_mip_gap}')
+			self.h.setOptionValue('mip_rel_gap', float(relative_mip_gap))
+
+	def set_threads(self, threads):
+		self.h.setOptionValue('threads', int(threads))
+
+	def read(self, problem_path):
+		if self.h.readModel(problem_path) == highspy.HighsStatus.kError:
+			raise ValueError(f"HiGHS could not read {problem_path}")
+
+	def load_model(self, model, since=None):
+		if since is not None:
+			self.append_model(model, since)
+			return
+		arrays = model.to_arrays()
+		lp = highspy.HighsLp()
+		lp.num_col_ = len(arrays.obj)
+		lp.num_row_ = len(arrays.rhs)
+		lp.sense_ = highspy.ObjSense.kMaximize
+		lp.col_cost_ = arrays.obj
+		lp.col_lower_ = arrays.lb
+		lp.col_upper_ = arrays.ub
+		lower_rows = np.isin(arrays.senses, ['>=', '>', '='])
+		upper_rows = np.isin(arrays.senses, ['<=', '<', '='])
+		lp.row_lower_ = np.where(lower_rows, arrays.rhs, -np.inf)
+		lp.row_upper_ = np.where(upper_rows, arrays.rhs, np.inf)
+		lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+		lp.a_matrix_.num_col_ = lp.num_col_
+		lp.a_matrix_.num_row_ = lp.num_row_
+		lp.a_matrix_.start_ = arrays.indptr
+		lp.a_matrix_.index_ = arrays.indices
+		lp.a_matrix_.value_ = arrays.data
+		lp.integrality_ = [highspy.HighsVarType.kContinuous if t == 'C' else highspy.HighsVarType.kInteger
+						   for t in arrays.types]
+		lp.col_names_ = model.vars.names_of(np.arange(lp.num_col_)).tolist()
+		lp.row_names_ = list(arrays.row_names)
+		if self.h.passModel(lp) == highspy.HighsStatus.kError:
+			raise ValueError("HiGHS rejected the model")
+
+	def append_model(self, model, since):
+		h = self.h
+		incumbent = None
+		if h.getInfo().primal_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible:
+			incumbent = np.array(h.getSolution().col_value)
+		arrays = model.to_arrays(since=since)
+		n_cols, n_rows = len(arrays.obj), len(arrays.rhs)
+		empty = np.array([], dtype=np.int32)
+		h.addCols(n_cols, arrays.obj, arrays.lb, arrays.ub, 0, empty, empty, np.array([]))
+		new_cols = np.arange(arrays.col_start, arrays.col_start + n_cols, dtype=np.int32)
+		is_integer = arrays.types != 'C'
+		h.changeColsIntegrality(int(is_integer.sum()), new_cols[is_integer],
+								np.full(int(is_integer.sum()), highspy.HighsVarType.kInteger))
+		for col, name in zip(new_cols, model.vars.names_of(new_cols)):
+			h.passColName(int(col), name)
+		lower_rows = np.isin(arrays.senses, ['>=', '>', '='])
+		upper_rows = np.isin(arrays.senses, ['<=', '<', '='])
+		first_row = h.getNumRow()
+		h.addRows(n_rows, np.where(lower_rows, arrays.rhs, -np.inf), np.where(upper_rows, arrays.rhs, np.inf),
+				  len(arrays.data), arrays.indptr[:-1].astype(np.int32), arrays.indices, arrays.data)
+		for row, name in enumerate(arrays.row_names):
+			h.passRowName(first_row + row, name)
+		if incumbent is not None:
+			# Previous solution for the old columns; HiGHS completes the new ones
+			h.setSolution(len(incumbent), np.arange(len(incumbent), dtype=np.int32), incumbent)
+
+	def read_start(self, warm_start):
+		# Partial MIP start from the variable values of a .sol or .mst file; variables it does not name are left free
+		col_index = {name: i for i, name in enumerate(self.h.getLp().col_names_)}
+		indices, values = [], []
+		for _, element in et.iterparse(warm_start):
+			if element.tag == 'variable':
+				i = col_index.get(element.attrib['name'])
+				if i is not None:
+					indices.append(i)
+					values.append(float(element.attrib['value']))
+				element.clear()
+		self.h.setSolution(len(indices), np.array(indices, dtype=np.int32), np.array(values, dtype=np.float64))
+
+	def set_lazy_rows(self, separator):
+		# highspy has no lazy constraint callback: solve() instead adds the rows the optimum violates and
+		# re-solves in the same session, from that optimum, until it violates none
+		self.lazy_rows = separator
+
+	def add_rows(self, names, ids, coefs, senses, rhs):
+		senses, rhs = np.array(list(senses)), np.asarray(rhs, dtype=np.float64)
+		indptr = np.concatenate([[0], np.cumsum([len(row) for row in ids])]).astype(np.int32)
+		first_row = self.h.getNumRow()
+		self.h.addRows(len(rhs), np.where(np.isin(senses, ['G', 'E']), rhs, -np.inf), np.where(np.isin(senses, ['L', 'E']), rhs, np.inf),
+					   int(indptr[-1]), indptr[:-1], np.concatenate(ids).astype(np.int32), np.concatenate(coefs).astype(np.float64))
+		for row, name in enumerate(names):
+			self.h.passRowName(first_row + row, name)
+
+	def solve(self):
+		while True:
+			self.h.run()
+			status = self.h.getModelStatus()
+			status_string = self.h.modelStatusToString(status)
+			info = self.h.getInfo()
+			if info.primal_solution_status != highspy.SolutionStatus.kSolutionStatusFeasible:
+				raise NoSolutionError(f"HiGHS found no feasible solution: {status_string}")
+			if self.lazy_rows is None:
+				break
+			values = np.array(self.h.getSolution().col_value)
+			names, ids, coefs, senses, rhs = self.lazy_rows(values)
+			if len(rhs) == 0:
+				break
+			self.add_rows(names, ids, coefs, senses, rhs)
+			# The optimum violates the new rows; setting their coreview vars (the first term of each row)
+			# makes it a feasible start again
+			values[np.asarray(ids)[:, 0]] = 1
+			self.h.setSolution(len(values), np.arange(len(values), dtype=np.int32), values)
+		return int(status), status_string, info.objective_function_value
+
+	def write_solution(self, solution_file):
+		status = self.h.getModelStatus()
+		lp = self.h.getLp()
+		solution = self.h.getSolution()
+		row_upper = np.asarray(lp.row_upper_)
+		row_lower = np.asarray(lp.row_lower_)
+		rhs = np.where(np.isfinite(row_upper), row_upper, row_lower)
+		slacks = rhs - np.asarray(solution.row_value)
+		with open(solution_file, 'w') as fh:
+			fh.write('<?xml version = "1.0" standalone="yes"?>\n<CPLEXSolution version="1.2">\n')
+			fh.write(' <header\n   objectiveValue="{}"\n   solutionStatusValue="{}"\n   solutionStatusString={}/>\n'.format(
+				self.h.getInfo().objective_function_value, int(status), quoteattr(self.h.modelStatusToString(status))))
+			# duals and reduced costs as CPLEX writes them for an LP (reduced cost = cost - duals^T column)
+			row_duals = [' dual="{!r}"'.format(d) for d in solution.row_dual] if solution.dual_valid else [''] * lp.num_row_
+			col_duals = [' reducedCost="{!r}"'.format(d) for d in solution.col_dual] if solution.dual_valid else [''] * lp.num_col_
+			fh.write(' <linearConstraints>\n')
+			for i, (name, slack, dual) in enumerate(zip(lp.row_names_, slacks, row_duals)):
+				fh.write('  <constraint name={} index="{}" slack="{!r}"{}/>\n'.format(quoteattr(name), i, float(slack), dual))
+			fh.write(' </linearConstraints>\n <variables>\n')
+			for i, (name, value, reduced_cost) in enumerate(zip(lp.col_names_, solution.col_value, col_duals)):
+				fh.write('  <variable name={} index="{}" value="{!r}"{}/>\n'.format(quoteattr(name), i, value, reduced_cost))
+			fh.write(' </variables>\n</CPLEXSolution>\n')
+
+
+BACKENDS = {backend.name: backend for backend in [CplexBackend, HighsBackend]}
+
+
+def solve(problem_path=None, solution_file=None, warm_start=None, abstol=None, relative_mip_gap=None, model=None, backend='cplex', solver=None, since=None, lazy_rows=None):
+	# With model (a BaseILP) the problem is loaded from memory; problem_path then only names the output files
+	# and need not exist. solver is a live SolverBackend to reuse, which is left open for the next call; with
+	# since (a ModelMark) only the part of model added after the mark is appended to what solver already holds.
+	# lazy_rows is a separator (see SolverBackend.set_lazy_rows) whose rows are added during the solve.
 	if problem_path is None:
 		raise ValueError("must provide path to problem")
 
 	if solution_file is None:
 		solution_file = problem_path.replace('.lp', '.sol')
 
-	cplex_log_file = problem_path.replace('.lp', '_cplex.log')
+	own_solver = solver is None
+	if own_solver:
+		solver = make_solver(backend, abstol=abstol, relative_mip_gap=relative_mip_gap)
+	solver.open_log(problem_path.replace('.lp', f'_{solver.name}.log'))
 
-	cpx = cplex.Cplex()
-	if abstol is not None:
-		print(f'Setting abs mip tol to {abstol}')
-		cpx.parameters.mip.tolerances.absmipgap.set(abstol)
-	if relative_mip_gap:
-		print(f'Setting relative mip gap to {relative_mip_gap}')
-		cpx.parameters.mip.tolerances.mipgap.set(relative_mip_gap)
 	start_time = time.time()
 	try:
-		with open(cplex_log_file, 'w') as cplexlog:
-			cpx.set_results_stream(cplexlog)
-			cpx.set_warning_stream(cplexlog)
-			cpx.set_error_stream(cplexlog)
-			cpx.set_log_stream(cplexlog)
-			#time.sleep(5)
-			cpx.read(problem_path)
-			if warm_start is not None:
-				if not os.path.exists(warm_start):
-					raise ValueError(f"File {warm_start} should be a solution file. But does not exist?")
-				cpx.start.read_start(warm_start)
-			cpx.solve()
-			status = cpx.solution.get_status()
-			status_string = cpx.solution.get_status_string()
-			obj = cpx.solution.get_objective_value()
-			print(f"Status {status}: {status_string}")
-			print(f"Objective {obj}")
-			cpx.solution.write(solution_file)
-			print("Wrote solution to %s" % solution_file)
-			cpx.end()
-	except Exception as e:
+		if model is not None:
+			solver.load_model(model, since=since)
+		else:
+			solver.read(problem_path)
+		if warm_start is not None:
+			if not os.path.exists(warm_start):
+				raise ValueError(f"File {warm_start} should be a solution file. But does not exist?")
+			solver.read_start(warm_start)
+		if lazy_rows is not None:
+			solver.set_lazy_rows(lazy_rows)
+		status, status_string, obj = solver.solve()
+		print(f"Status {status}: {status_string}")
+		print(f"Objective {obj}")
+		solver.write_solution(solution_file)
+		print("Wrote solution to %s" % solution_file)
+	except SOLVER_ERRORS as e:
 		print(e)
 		status = '1217'
 		status_string = 'Infeasible'
 		print("Infeasible, no solution to write!")
 		obj=-10000000
+	finally:
+		if own_solver:
+			solver.close()
 
 	end_time = time.time()
 
 	with open(problem_path.replace('.lp', '_status.json'),'w') as f:
 		status_dict = {'time': end_time-start_time,
 						'status': f'{status}: {status_string}',
-						'objective': obj}
+						'objective': obj,
+						'backend': solver.name}
 		f.write(json.dumps(status_dict))
 
 	return solution_file
 
 
+def make_solver(backend='cplex', abstol=None, relative_mip_gap=None, threads=None):
+	# A solver session to pass to solve() across iterations
+	if backend not in BACKENDS:
+		raise ValueError(f"Unknown solver backend {backend}, expected one of {list(BACKENDS)}")
+	solver = BACKENDS[backend]()
+	solver.set_tolerances(abstol=abstol, relative_mip_gap=relative_mip_gap)
+	threads = threads or default_threads
+	if threads:
+		solver.set_threads(threads)
+	return solver
+
+def set_default_threads(threads):
+	# Caps the threads of every solver this process makes, e.g. in each worker of a process pool
+	global default_threads
+	default_threads = threads
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--problem_path", help="problem file to read", default='./data/problem.lp')
@@ -69,5 +432,6 @@ if __name__ == '__main__':
     parser.add_argument("--warm_start", help="solution file to warm start", default=None)
     parser.add_argument("--results_file", help="place to store results of analysis", default=None)
     parser.add_argument("--abstol", help="CPLEX param abstol", default=None, type=int)
+    parser.add_argument("--backend", help="solver to use", default='cplex', choices=['cplex', 'highs'])
     args = parser.parse_args()
     solve(**vars(args))
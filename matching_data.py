@@ -1,10 +1,10 @@
 import pandas as pd
 from dataclasses import dataclass
 from compute_scores import compute_scores
+from data_cache import load_scores, scores_cache_key, scores_cache_dir, data_cache_key, load_matching_data, save_matching_data
 import json
 from create_indicator import create_paper_reviewer_df
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
@@ -13,15 +13,33 @@ class MatchingData:
 	reviewer_df: pd.DataFrame
 	paper_reviewer_df: pd.DataFrame
 	distance_df: pd.DataFrame
+	# With get_data(keep_candidates=True): every pair the sparsified pairs were picked from (same layout as
+	# paper_reviewer_df), and the reviewer table for all of their reviewers
+	candidate_df: pd.DataFrame = None
+	candidate_reviewer_df: pd.DataFrame = None
+
+def filter_reviewers(reviewer_df, paper_reviewer_df):
+	# Rows of reviewer_df for the reviewers that appear in paper_reviewer_df
+	existing_reviewers = paper_reviewer_df.index.get_level_values('reviewer').unique()
+	return reviewer_df.reset_index().query('reviewer in @existing_reviewers').set_index('reviewer')
 	
-def get_data(config, per_reviewer_num_indicators=None, per_paper_num_indicators=None, rebuild_scores_file=False):
+def get_data(config, per_reviewer_num_indicators=None, per_paper_num_indicators=None, rebuild_scores_file=False, keep_candidates=False):
+	# The prepared data is cached under a hash of the input files and the parameters it depends on
+	data_key = data_cache_key(config, per_reviewer_num_indicators, per_paper_num_indicators, keep_candidates=keep_candidates)
+	if not rebuild_scores_file:
+		matching_data = load_matching_data(config, data_key)
+		if matching_data is not None:
+			logger.info(f"Inputs unchanged, read prepared data from cache entry {data_key}")
+			return matching_data
+
 	logger.info("Computing aggregate scores from raw scores...")
 
-	if os.path.isfile(config['CACHED_SCORES_FILE']) and not rebuild_scores_file:
-		logger.info(f"Cached file {config['CACHED_SCORES_FILE']} exists. Reading from file...")
-		scores_df = pd.read_csv(config['CACHED_SCORES_FILE']).set_index(['paper','reviewer'])
+	scores_key = scores_cache_key(config)
+	scores_df = None if rebuild_scores_file else load_scores(config, key=scores_key)
+	if scores_df is not None:
+		logger.info(f"Read cached scores from {scores_cache_dir(config)}")
 	else:
-		scores_df = compute_scores(config)
+		scores_df = compute_scores(config, cache_key=scores_key)
 
 	bids_df = pd.read_csv(config['BIDS_FILE']).set_index(['paper','reviewer'])
 	reviewer_df = pd.read_csv(config['REVIEWERS_FILE']).set_index('reviewer')
@@ -37,20 +55,26 @@ def get_data(config, per_reviewer_num_indicators=None, per_paper_num_indicators=
 	distance_df = pd.read_csv(config['COAUTHOR_DISTANCE_FILE']).set_index(['reviewer_1','reviewer_2'])
 
 	logger.info("Sparsifying problem...")
-	paper_reviewer_df = create_paper_reviewer_df(config=config,
+	sparsified = create_paper_reviewer_df(config=config,
 			scores_df=scores_df, 
             reviewer_df=reviewer_df,
             bids_df=bids_df, 
             k=config['HYPER_PARAMS']['sparsity_k'],
             score_threshold=config['HYPER_PARAMS']['score_threshold'],
             per_reviewer_num_indicators=per_reviewer_num_indicators,
-			per_paper_num_indicators=per_paper_num_indicators)
+			per_paper_num_indicators=per_paper_num_indicators,
+			return_candidates=keep_candidates)
+	paper_reviewer_df, candidate_df = sparsified if keep_candidates else (sparsified, None)
 
 	# Filter out any reviewers from reviewer_df that are not in paper_reviewer_df
-	existing_reviewers = paper_reviewer_df.index.get_level_values('reviewer').unique()
-	reviewer_df = reviewer_df.reset_index().query('reviewer in @existing_reviewers').set_index('reviewer')
+	candidate_reviewer_df = filter_reviewers(reviewer_df, candidate_df) if keep_candidates else None
+	reviewer_df = filter_reviewers(reviewer_df, paper_reviewer_df)
 
-	return MatchingData(
+	matching_data = MatchingData(
         reviewer_df=reviewer_df,
         paper_reviewer_df=paper_reviewer_df,
-    	distance_df=distance_df)
\ No newline at end of file
+    	distance_df=distance_df,
+		candidate_df=candidate_df,
+		candidate_reviewer_df=candidate_reviewer_df)
+	save_matching_data(config, data_key, matching_data)
+	return matching_data
\ No newline at end of file
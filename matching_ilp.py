@@ -2,7 +2,8 @@ import pandas as pd
 import numpy as np
 import logging
 import yaml
-from base_ilp import BaseILP, Equation, Objective, Constraints, General
+from base_ilp import BaseILP, Equation, Objective, Constraints, General, pair_names
+from create_indicator import pack_pairs
 from tqdm import tqdm
 from collections import defaultdict
 
@@ -11,6 +12,35 @@ logger = logging.getLogger(__name__)
 def to_name(output_files_prefix):
     return output_files_prefix + '.lp'
 
+def matching_var_names(papers, reviewers):
+    # Bulk version of 'x{}_{}'.format(paper, reviewer) over aligned arrays
+    return pair_names('x', papers, reviewers).tolist()
+
+class PaperIndex:
+    # Per-paper view of paper_reviewer_df, built once: the rows of every paper are stored contiguously
+    # (in their original order) so that paper i owns the slice indptr[i]:indptr[i+1] of the row arrays.
+    def __init__(self, paper_reviewer_df, reviewer_df, matching_ids):
+        index = paper_reviewer_df.index
+        codes, self.papers = pd.factorize(index.get_level_values('paper'))
+        self.rows = np.argsort(codes, kind='stable')
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(self.papers)))])
+
+        self.ids = matching_ids[self.rows]
+        self.reviewers = index.get_level_values('reviewer').values[self.rows]
+        self.roles = paper_reviewer_df['role'].values[self.rows]
+        reviewer_info = reviewer_df[['seniority', 'region']].reindex(self.reviewers)
+        self.seniorities = reviewer_info['seniority'].values
+        self.regions = reviewer_info['region'].values
+
+    def __len__(self):
+        return len(self.papers)
+
+    def items(self, sort=False):
+        # (paper, slice into the row arrays), in order of first appearance or sorted by paper id
+        order = np.argsort(self.papers, kind='stable') if sort else range(len(self.papers))
+        for i in order:
+            yield self.papers[i], slice(self.indptr[i], self.indptr[i + 1])
+
 class MatchingILP(BaseILP):
 
     def __init__(self,
@@ -21,10 +51,17 @@ class MatchingILP(BaseILP):
                 co_review_vars,
                 add_soft_constraints=True,
                 fixed_variable_solution_file=None,
-                output_files_prefix=''
+                output_files_prefix='',
+                relax_matching=False,
+                lazy_coreview=False
                 ):
         super().__init__()
 
+        # relax_matching declares the x vars continuous in [0, 1]. Without soft constraints the model is then a
+        # bipartite b-matching LP, whose constraint matrix is totally unimodular: a simplex vertex is integral.
+        if relax_matching and add_soft_constraints:
+            raise ValueError("relax_matching is only exact without soft constraints")
+
         self.paper_reviewer_df = paper_reviewer_df
         self.reviewer_df = reviewer_df
         self.distance_df = distance_df
@@ -32,10 +69,34 @@ class MatchingILP(BaseILP):
         self.add_soft_constraints = add_soft_constraints
         self.co_review_vars = co_review_vars
         self.bidding_cycles = None
+        # Coreview triples and reviewer pairs in the model, so row generation only adds new ones
+        self.coreview_triples = set()
+        self.coreview_pairs = set()
+        self.distance_pairs = None
         self.fixed_variable_solution_file = fixed_variable_solution_file
         self.output_files_prefix= output_files_prefix
-
-    def create_ilp(self,lp_filename=''):
+        self.relax_matching = relax_matching
+        # lazy_coreview declares the coreview vars of every candidate triple up front, for the coreview rows to
+        # be added as lazy constraints during the solve (see lazy_coreview.py)
+        self.lazy_coreview = lazy_coreview
+        self.lazy_triples = None
+
+        # Variable ids aligned with the rows of paper_reviewer_df, and a reviewer -> row positions
+        # index, both computed once and shared by every per-reviewer constraint family
+        index = self.paper_reviewer_df.index
+        self.matching_ids = self.vars.add_pairs('x', index.get_level_values('paper'), index.get_level_values('reviewer'))
+        self.reviewer_rows = self.paper_reviewer_df.groupby(level='reviewer', sort=False).indices
+        # Same for per-paper constraint families
+        self.paper_index = PaperIndex(self.paper_reviewer_df, self.reviewer_df, self.matching_ids)
+
+    def get_reviewer_ids(self, rid):
+        # Matching variable ids of reviewer rid, in paper_reviewer_df row order
+        rows = self.reviewer_rows.get(rid, np.array([], dtype=np.int64))
+        return self.matching_ids[rows]
+
+    def create_ilp(self,lp_filename='',write_lp=True):
+        # With write_lp=False the model is only built (e.g. to be handed to the solver from memory);
+        # the yml with the config is written either way
 
         #TODO: Check that every paper has reviewers and vice versa
         
@@ -58,6 +119,9 @@ class MatchingILP(BaseILP):
             self.add_coreview_constraints()
             logger.info('Co-author distance Objective')
             self.add_coreview_distance_objective() 
+            if self.lazy_coreview:
+                logger.info('Coreview candidates for lazy constraints')
+                self.add_coreview_candidates()
 
             logger.info('Seniority Objectives')
             self.add_seniority_reward()
@@ -77,186 +141,231 @@ class MatchingILP(BaseILP):
             self.add_paper_distribution_constraints_obj_limits(role='SPC',num_papers_list=[8,12,16,20,24])
 
            
+        self.shrink()
+        logger.info('Model has %d variables, %d constraints, %d nonzeros (%.1f MB)' % (
+            len(self.vars), len(self.constraints), len(self.constraints.indices), self.nbytes() / 2**20))
+        self.write_outputs(lp_filename, write_lp=write_lp)
+
+    def write_outputs(self, lp_filename, write_lp=True):
         logger.info('Start writing! Phew!')
 
-        self.write_to_file(lp_filename)
-        logger.info("Wrote out %s to file" % lp_filename)
+        if write_lp:
+            self.write_to_file(lp_filename)
+            logger.info("Wrote out %s to file" % lp_filename)
         # Write out yml file for managing experiments
-        yml_filename = lp_filename.replace('lp','yml')
+        yml_filename = lp_filename[:-len('.gz')] if lp_filename.endswith('.gz') else lp_filename
+        yml_filename = yml_filename.replace('lp','yml')
         with open(yml_filename, 'w') as fh:
             yaml.dump(self.config, fh)
         logger.info('End writing! Phew!')
 
     '''*********** Objective function **********'''
     def add_reviewer_matching_objective(self):
-        paper_reviewer_tuples = self.paper_reviewer_df.index.values 
-        matching_vars = ['x{}_{}'.format(i,j) for i, j in paper_reviewer_tuples]
-        self.binary.add(matching_vars)
-        matching_vars_scores = [self.paper_reviewer_df.loc[(i, j)]['score'].item() for i,j in paper_reviewer_tuples]
-        eqn = Equation('obj','',list(zip(matching_vars, matching_vars_scores)), None, None)
-        self.objective.add(eqn)
+        if self.relax_matching:
+            self.bounds.add_ids(self.matching_ids, 0, 1)
+        else:
+            self.binary.add_ids(self.matching_ids)
+        # One columnar pass over the scores, aligned with the variable ids
+        matching_vars_scores = self.paper_reviewer_df['score'].values
+        self.objective.add_rows([self.matching_ids], [matching_vars_scores])
 
     '''*********** Capacity Constraints **********'''
     # Restrict number of papers that can be assigned to a given reviewer
     def add_reviewer_capacity_constraints(self):
-        all_eqns = []
+        names, terms, rhs = [], [], []
 
         for rid, role in tqdm(self.reviewer_df['role'].items(), total=self.reviewer_df.index.size, desc="Building reviewer capacity constraints..."):
+            names.append('reviewer_capacity_{}_{}'.format(rid, role))
+            terms.append(self.get_reviewer_ids(rid))
+            rhs.append(self.config['HYPER_PARAMS'][f'max_papers_per_reviewer_{role}'])
 
-            papers = self.paper_reviewer_df.query(f'reviewer == {rid}').index.get_level_values('paper')
-            paper_vars = list(map(lambda x: 'x{}_{}'.format(x,rid),papers))
-            coefs = [1]*len(paper_vars)
-            oper = '<='
-            rhs = self.config['HYPER_PARAMS'][f'max_papers_per_reviewer_{role}']
-
-            eqn = Equation(eqn_type='cons',name='reviewer_capacity_{}_{}'.format(rid, role),
-                  var_coefs=list(zip(paper_vars,coefs)),oper=oper,
-                  rhs=rhs)
-            all_eqns.append(eqn)
-
-        self.constraints.add(all_eqns)
+        self.constraints.add_rows(names, terms, 1, '<=', rhs)
 
     # Restrict number of reviewers that can be assigned to a given paper
     def add_paper_capacity_constraints(self): #1
-        all_eqns = []
+        names, terms, rhs = [], [], []
+        paper_index = self.paper_index
 
-        for group_name, group in self.paper_reviewer_df.reset_index().groupby(['paper','role']):
-            reviewers = group['reviewer'] 
-            pid = group_name[0]    
-            role = group_name[1]          
+        for pid, rows in paper_index.items(sort=True):
+            roles = paper_index.roles[rows]
+            for role in np.unique(roles):
+                names.append('paper_capacity_{}_{}'.format(role,pid))
+                terms.append(paper_index.ids[rows][roles == role])
+                rhs.append(self.config['HYPER_PARAMS'][f'max_reviews_per_paper_{role}'])
 
-            reviewer_vars = list(map(lambda x: 'x{}_{}'.format(pid,x),reviewers))
-            coefs = [1]*len(reviewer_vars)
-            oper = '<=' if self.config['HYPER_PARAMS']['relax_paper_capacity'] else '='
-            rhs = self.config['HYPER_PARAMS'][f'max_reviews_per_paper_{role}']
-
-            eqn_ac = Equation(eqn_type='cons',name='paper_capacity_{}_{}'.format(role,pid),
-                  var_coefs=list(zip(reviewer_vars,coefs)),oper=oper,
-                  rhs=rhs)
-            all_eqns.append(eqn_ac)
-
-        self.constraints.add(all_eqns)
+        oper = '<=' if self.config['HYPER_PARAMS']['relax_paper_capacity'] else '='
+        self.constraints.add_rows(names, terms, 1, oper, rhs)
 
     '''*********** Soft constraints **********'''
     # Set coreview vars. coreview_ij at least 0. If x_ij and x_ji, then coreview_ij must be at least 1.
-    def add_coreview_constraints(self):
+    def add_coreview_constraints(self, triples=None):
         #[Constraint] coreviews_jj’ >= x_ij + x_ij’ - 1 
         #(for all j, j’, i, j and j’ in PC)
+        # triples defaults to co_review_vars; triples already in the model are skipped
 
-        if self.co_review_vars is None:
-            logger.warning("Co review var empty. Not adding any coreview constraints")
-            return
+        if triples is None:
+            if self.co_review_vars is None:
+                logger.warning("Co review var empty. Not adding any coreview constraints")
+                return
+            triples = self.co_review_vars
 
-        pairs = list(map(lambda x: 'coreview{}_{}'.format(x[0],x[1]), self.co_review_vars))
-        self.bounds.add(pairs,[0]*len(pairs),None)
-        self.general.add(pairs)
+        triples = [t for t in triples if t not in self.coreview_triples]
+        self.coreview_triples.update(triples)
+        if len(triples) == 0:
+            return
 
-        for (rid_i, rid_j, this_pid) in self.co_review_vars:
-            co_review_var = 'coreview{}_{}'.format(rid_i,rid_j)
-            eqn_vars = [co_review_var, 'x{}_{}'.format(this_pid,rid_i), 'x{}_{}'.format(this_pid,rid_j)]
-            coefs = [1.0, -1.0, -1.0]
-            eqn = Equation(eqn_type='cons',name='coreview_{}_{}_{}'.format(this_pid, rid_i, rid_j),
-                        var_coefs=list(zip(eqn_vars,coefs)),oper='>=',rhs=-1)
-            self.constraints.add(eqn)
+        n_vars = len(self.vars)
+        pair_ids = self.vars.get_ids(['coreview{}_{}'.format(rid_i, rid_j) for (rid_i, rid_j, _) in triples])
+        first_ids = self.vars.get_ids(['x{}_{}'.format(pid, rid_i) for (rid_i, _, pid) in triples])
+        second_ids = self.vars.get_ids(['x{}_{}'.format(pid, rid_j) for (_, rid_j, pid) in triples])
 
-    def add_coreview_distance_objective(self): #6      
-        # Only want to penalize when no AC involved
+        # Coreview vars are shared by all papers of a reviewer pair; only declare the ones new to the model
+        new_pair_ids = pd.unique(pair_ids[pair_ids >= n_vars])
+        self.bounds.add_ids(new_pair_ids, 0, np.nan)
+        self.general.add_ids(new_pair_ids)
 
-        if self.co_review_vars is None:
-            logger.warning("Co review var empty. Cannot contruct coauthor distance constraints")
-            return
+        names = ['coreview_{}_{}_{}'.format(pid, rid_i, rid_j) for (rid_i, rid_j, pid) in triples]
+        terms = np.stack([pair_ids, first_ids, second_ids], axis=1)
+        coefs = np.tile([1.0, -1.0, -1.0], (len(triples), 1))
+        self.constraints.add_rows(names, terms, coefs, '>=', -1)
 
-        def add(distance_df, penalty):
-            # Take to take set over the i,j sets. Here we are taking set over  
-            reviewer_pairs_within_distance = set(distance_df.index.values)
-            coreviewer_var_pairs = set((i,j) for (i, j, _) in self.co_review_vars)
-            pairs_to_add = coreviewer_var_pairs.intersection(reviewer_pairs_within_distance)
+    def add_coreview_distance_objective(self, triples=None): #6      
+        # Only want to penalize when no AC involved
+        # triples defaults to co_review_vars; reviewer pairs penalized before are skipped
+
+        if triples is None:
+            if self.co_review_vars is None:
+                logger.warning("Co review var empty. Cannot contruct coauthor distance constraints")
+                return
+            triples = self.co_review_vars
+
+        # Take to take set over the i,j sets. Here we are taking set over  
+        coreviewer_var_pairs = set((i,j) for (i, j, _) in triples) - self.coreview_pairs
+        self.coreview_pairs |= coreviewer_var_pairs
+
+        for d, penalty in [(0, self.config['HYPER_PARAMS']['coreview_dis0_pen']), (1, self.config['HYPER_PARAMS']['coreview_dis1_pen'])]:
+            pairs_to_add = coreviewer_var_pairs.intersection(self.get_distance_pairs()[d])
+            if len(pairs_to_add) == 0:
+                continue
             dis_vars = [f'coreview{i}_{j}' for (i, j) in pairs_to_add]
             logger.info(f'Adding {len(dis_vars)} distance penalties of {penalty}')
-            pen = [penalty] * len(dis_vars)
-            eqn = Equation('obj','',list(zip(dis_vars, pen)), None, None)
-            self.objective.add(eqn)
-
-        # Filter out ACs from distance dataframe
-        ac_reviewers = self.reviewer_df.query(f'role == "AC"').index.values
-        distance_df = self.distance_df.query('reviewer_1 not in @ac_reviewers').query('reviewer_2 not in @ac_reviewers')
-
-        add(distance_df.query(f'distance == 0'), self.config['HYPER_PARAMS']['coreview_dis0_pen'])
-        add(distance_df.query(f'distance == 1'), self.config['HYPER_PARAMS']['coreview_dis1_pen'])
-    
+            self.objective.add_rows([self.vars.get_ids(dis_vars)], penalty)
+
+    def get_distance_pairs(self):
+        # distance -> set of (reviewer_1, reviewer_2) pairs, without ACs
+        if self.distance_pairs is None:
+            # Filter out ACs from distance dataframe
+            ac_reviewers = self.reviewer_df.query(f'role == "AC"').index.values
+            distance_df = self.distance_df.query('reviewer_1 not in @ac_reviewers').query('reviewer_2 not in @ac_reviewers')
+            self.distance_pairs = {d: set(distance_df.query(f'distance == {d}').index.values) for d in [0, 1]}
+        return self.distance_pairs
+
+    def add_coreview_candidates(self):
+        # Every (paper, reviewer_1 < reviewer_2) triple of non-AC candidates of the same paper at a penalized
+        # distance (0, and 1 with include_d1), found with a self-join of the candidates on paper. Their coreview
+        # vars are declared with their distance penalty but without any coreview row: the rows are only added,
+        # as lazy constraints, for the triples an incumbent violates. Sets lazy_triples, with the var ids of
+        # every triple.
+        distances = [0, 1] if self.config['HYPER_PARAMS']['include_d1'] else [0]
+        penalized = np.array([pair for d in distances for pair in self.get_distance_pairs()[d]], dtype=np.int64).reshape(-1, 2)
+        penalized_keys = np.unique(pack_pairs(penalized[:, 0], penalized[:, 1]))
+
+        index = self.paper_reviewer_df.index
+        candidates = pd.DataFrame({'paper': index.get_level_values('paper').values,
+                                   'reviewer': index.get_level_values('reviewer').values,
+                                   'x_id': self.matching_ids})[self.paper_reviewer_df['role'].values != 'AC']
+        triples = candidates.merge(candidates, on='paper', suffixes=('_1', '_2'))
+        triples = triples[triples['reviewer_1'] < triples['reviewer_2']]
+        triples = triples[np.isin(pack_pairs(triples['reviewer_1'].values, triples['reviewer_2'].values), penalized_keys)].reset_index(drop=True)
+
+        n_vars = len(self.vars)
+        pair_ids = self.vars.get_ids(['coreview{}_{}'.format(i, j) for (i, j) in zip(triples['reviewer_1'], triples['reviewer_2'])])
+        new_pair_ids = pd.unique(pair_ids[pair_ids >= n_vars])
+        self.bounds.add_ids(new_pair_ids, 0, np.nan)
+        self.general.add_ids(new_pair_ids)
+        self.add_coreview_distance_objective([(i, j, None) for (i, j) in zip(triples['reviewer_1'], triples['reviewer_2'])])
+        triples['coreview_id'] = pair_ids
+        self.lazy_triples = triples
+        logger.info(f'{len(triples)} candidate coreview triples over {len(new_pair_ids)} reviewer pairs')
+
+    def add_coreview_triples(self, triples):
+        # Row generation step: adds the coreview variables, constraints and distance penalties of the triples
+        # not yet in the model. Work is proportional to the new triples, not to the model size.
+        self.add_coreview_constraints(triples)
+        self.add_coreview_distance_objective(triples)
 
     def add_seniority_reward(self):
+        paper_index = self.paper_index
+        slack_names = ['sen_slack_{}'.format(paper) for paper in paper_index.papers]
+        slack_ids = self.vars.get_ids(slack_names)
+        terms, coefs = [], []
 
-        for paper in tqdm(self.paper_reviewer_df.index.unique('paper'), desc="Building seniority constraints..."):
+        for (paper, rows), sen_slack_id in tqdm(zip(paper_index.items(), slack_ids), total=len(paper_index), desc="Building seniority constraints..."):
 
-            pc_rids = self.paper_reviewer_df.query(f'paper == {paper} and role=="PC"').index.get_level_values('reviewer')
-            pc_vars = list(map(lambda x: 'x{}_{}'.format(paper,x),pc_rids))
+            is_pc = paper_index.roles[rows] == 'PC'
+            pc_ids = paper_index.ids[rows][is_pc]
 
-            if len(pc_vars) == 0:
+            if len(pc_ids) == 0:
                 raise Exception(f'Paper {paper} has no PC reviewers!')
 
-            seniorities = list(-1 * self.reviewer_df.loc[pc_rids]['seniority'].values)
-            coefs = seniorities
-
-            sen_slack_var = 'sen_slack_{}'.format(paper)
-            self.bounds.add(sen_slack_var, low=self.config['HYPER_PARAMS']['min_seniority'], up=self.config['HYPER_PARAMS']['target_seniority'])
-            self.general.add(sen_slack_var)
-            pc_vars.append(sen_slack_var)
-            coefs.append(1)
-            eqn_slbalance = Equation(eqn_type='cons',
-                              name='sen_slack_{}'.format(paper),
-                              var_coefs=list(zip(pc_vars,coefs)),oper='<=',
-                              rhs= 0
-                             )
-            self.constraints.add(eqn_slbalance)
-
-            # Reward objective function by slack var
-            var_coefs = [(sen_slack_var, self.config['HYPER_PARAMS']['sen_reward'])]
-            eqn = Equation('obj', 'sen_reward_{}'.format(paper), var_coefs, None, None)
-            self.objective.add(eqn)
+            seniorities = -1 * paper_index.seniorities[rows][is_pc]
+            terms.append(np.append(pc_ids, sen_slack_id))
+            coefs.append(np.append(seniorities, 1))
+
+        self.bounds.add_ids(slack_ids, low=self.config['HYPER_PARAMS']['min_seniority'], up=self.config['HYPER_PARAMS']['target_seniority'])
+        self.general.add_ids(slack_ids)
+        self.constraints.add_rows(slack_names, terms, coefs, '<=', 0)
+
+        # Reward objective function by slack var, one objective row per paper
+        self.objective.add_rows([[i] for i in slack_ids], self.config['HYPER_PARAMS']['sen_reward'])
 
     def add_region_objective(self): #5
         #(5) Region. Reward for every additional region on a paper
         #optimize  Reward*(reg_i)  
 
-        region_count_vars = ['region{}'.format(pid) for pid in self.paper_reviewer_df.index.unique('paper')]
+        region_count_ids = self.vars.get_ids(['region{}'.format(pid) for pid in self.paper_index.papers])
         region_reward = self.config['HYPER_PARAMS']['region_reward']
-        var_coefs = list(zip(region_count_vars,[region_reward]*len(region_count_vars)))
-        eqn = Equation('obj','region',var_coefs,None,None)
-        self.objective.add(eqn)
+        self.objective.add_rows([region_count_ids], region_reward)
 
     def add_region_constraints_and_bounds(self): #5
         #1st constraint
         #[Constraint] reg_i <= Sum_{Regions R} reg_iR
         #[Constraint] reg_iR <= Sum_{j are PC+SPC members s.t. Region_j=R}x_ij
-        eqns = []
+        paper_index = self.paper_index
         regions = self.reviewer_df['region'].unique()
-        for pid in self.paper_reviewer_df.index.unique('paper'):
-            this_vars = ['region{}'.format(pid)] + ['region{}_{}'.format(pid,this_region) for this_region in regions]
-            this_coefs = [1] + [-1]*len(regions)
-            eqn = Equation('cons','region_{}'.format(pid),list(zip(this_vars,this_coefs)),'<=',0)
-            eqns.append(eqn)
-
-        self.constraints.add(eqns)
+        this_coefs = np.array([1] + [-1]*len(regions))
+        terms = [self.vars.get_ids(['region{}'.format(pid)] + ['region{}_{}'.format(pid,this_region) for this_region in regions])
+                 for pid in paper_index.papers]
+        names = ['region_{}'.format(pid) for pid in paper_index.papers]
+        self.constraints.add_rows(names, terms, [this_coefs]*len(terms), '<=', 0)
         
-        eqns = []
-        all_region_vars = []
-        for region, region_df in self.reviewer_df.query("role != 'AC'").groupby('region'):
-            region_rids = region_df.index
-            for pid, pid_df in self.paper_reviewer_df.groupby(level='paper'):
-                region_reviewers = set(region_rids).intersection(set(pid_df.index.get_level_values('reviewer')))
-                region_vars = ['region{}_{}'.format(pid,region)]
-                this_vars = region_vars + [ 'x{}_{}'.format(pid,x) for x in region_reviewers]
-                all_region_vars += region_vars
-                this_coefs = [1] + [-1]*len(region_reviewers)
-                eqn = Equation('cons','region_{}_{}'.format(pid,region),list(zip(this_vars,this_coefs)),'<=',0)
-                eqns.append(eqn)
-
-        self.constraints.add(eqns)
+        # One pass over the papers to split each paper's PC+SPC variables by region
+        non_ac_regions = np.sort(self.reviewer_df.query("role != 'AC'")['region'].dropna().unique())
+        paper_region_vars = {}
+        for pid, rows in paper_index.items(sort=True):
+            non_ac = paper_index.roles[rows] != 'AC'
+            this_regions = paper_index.regions[rows][non_ac]
+            this_region_vars = paper_index.ids[rows][non_ac]
+            for region in non_ac_regions:
+                paper_region_vars[(region, pid)] = this_region_vars[this_regions == region]
+
+        names, region_names, terms, coefs = [], [], [], []
+        sorted_papers = np.sort(paper_index.papers)
+        for region in non_ac_regions:
+            for pid in sorted_papers:
+                region_reviewer_ids = paper_region_vars[(region, pid)]
+                names.append('region_{}_{}'.format(pid,region))
+                region_names.append('region{}_{}'.format(pid,region))
+                terms.append(region_reviewer_ids)
+                coefs.append(np.append(1, [-1]*len(region_reviewer_ids)))
+
+        all_region_ids = self.vars.get_ids(region_names)
+        terms = [np.append(region_id, region_reviewer_ids) for region_id, region_reviewer_ids in zip(all_region_ids, terms)]
+        self.constraints.add_rows(names, terms, coefs, '<=', 0)
         
         #add the bounds
         #reg_iR <= 1 [Bounds]
-        self.bounds.add(all_region_vars,None,[1]*len(all_region_vars))
+        self.bounds.add_ids(all_region_ids,np.nan,1)
 
     def populate_bidding_cycles(self):
         # Create a dict mapping from paper to list of authors
@@ -322,28 +431,24 @@ class MatchingILP(BaseILP):
     def add_paper_distribution_constraints_obj_limits(self,role='AC',num_papers_list=[20,30,40,50]):
 
         pen_dict = self.config['HYPER_PARAMS']['paper_distribution_pen'][role]
-        vars_for_objective = []
-        obj_coefs = []
+        reviewers = self.reviewer_df.query(f'role == "{role}"').index
+        slack_vars = ['paper_dist{}_{}'.format(reviewer,num_papers) for reviewer in reviewers for num_papers in num_papers_list]
+        slack_ids = self.vars.get_ids(slack_vars)
+        terms, coefs = [], []
         #iterate over each reviewer
-        for reviewer in self.reviewer_df.query(f'role == "{role}"').index:
+        for k, reviewer in enumerate(reviewers):
             #get valid papers for j
-            papers = self.paper_reviewer_df.query(f'reviewer == {reviewer}').index.get_level_values('paper')
-            for num_papers in num_papers_list:
-                slack_var = 'paper_dist{}_{}'.format(reviewer,num_papers)
-                dist_vars = ['x{}_{}'.format(paper,reviewer) for paper in papers] + [slack_var]
-                coefs = [1]*(len(dist_vars) -1 ) + [-1]
-                #add constraint 
-                eqn = Equation('cons','paper_dist{}_{}'.format(reviewer,num_papers), list(zip(dist_vars,coefs)),'<=', num_papers)
-                self.constraints.add(eqn)
-
-                #add bound
-                self.bounds.add(slack_var,low=0,up=None)
-                #add to objective vars
-                vars_for_objective.append(slack_var)
-                obj_coefs.append(pen_dict[num_papers])
-                #
-        obj_eqn = Equation('obj','paper_dist_obj',list(zip(vars_for_objective,obj_coefs)),None,None)
-        self.objective.add(obj_eqn)
+            paper_ids = self.get_reviewer_ids(reviewer)
+            this_coefs = np.append(np.ones(len(paper_ids)), -1)
+            for slack_id in slack_ids[k*len(num_papers_list):(k+1)*len(num_papers_list)]:
+                terms.append(np.append(paper_ids, slack_id))
+                coefs.append(this_coefs)
+
+        #add constraint, bound and objective for every (reviewer, num_papers) slack var
+        self.constraints.add_rows(slack_vars, terms, coefs, '<=', num_papers_list*len(reviewers))
+        self.bounds.add_ids(slack_ids,low=0,up=np.nan)
+        obj_coefs = [pen_dict[num_papers] for num_papers in num_papers_list]*len(reviewers)
+        self.objective.add_rows([slack_ids], [np.array(obj_coefs, dtype=np.float64)])
 
     def set_fixed_vars(self):
         logger.info("Fixing previous variable assignments from %s..." % self.fixed_variable_solution_file)
@@ -0,0 +1,177 @@
+import dataclasses
+import itertools
+import logging
+import multiprocessing
+import os
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from matching_data import MatchingData
+
+logger = logging.getLogger(__name__)
+
+# Offsets of the arrays in a shared memory block are aligned to this many bytes
+ALIGN_BYTES = 64
+LAYOUT_FILE = 'layout.pkl'
+# Attached shared memory blocks by name, kept open for as long as the process may use the frames on them
+_blocks = {}
+
+# A MatchingData is laid out as flat numpy arrays, one set per frame:
+#  - index: the values of a single index, or the codes (and, small, the levels) of each level of a MultiIndex
+#  - one array per numeric column
+#  - strings (role, region) as int codes of a categorical
+#  - lists of ints (conflict_papers, authored) as CSR offsets and values; these are rebuilt as lists on attach,
+#    the reviewer tables they live in being small
+# The arrays are written once to a shared memory block (share_matching_data) or to a directory of .npy files
+# (save_matching_data_columns), and every process attaches to them read-only without copying the columns.
+# pandas may still merge the numeric columns of one dtype into a private block on the first operation that
+# consolidates an attached frame (e.g. query); the index and categorical codes stay shared.
+
+def code_dtype(num_categories):
+    return np.int8 if num_categories < np.iinfo(np.int8).max else np.int32
+
+def is_list_column(values):
+    return values.dtype == object and len(values) > 0 and values.map(lambda v: isinstance(v, list)).all()
+
+def encode_frame(df):
+    # (layout, arrays) of a frame; arrays keys are relative to the frame
+    arrays = {}
+    index = df.index
+    if isinstance(index, pd.MultiIndex):
+        levels = [level.values for level in index.levels]
+        for i, codes in enumerate(index.codes):
+            arrays[f'index/codes/{i}'] = np.asarray(codes)
+    else:
+        levels = None
+        arrays['index/values'] = index.values
+    layout = {'index_names': list(index.names), 'levels': levels, 'columns': []}
+
+    for position, (name, values) in enumerate(df.items()):
+        if is_list_column(values):
+            lengths = values.map(len).values
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            arrays[f'{position}/offsets'] = offsets
+            arrays[f'{position}/values'] = np.fromiter(itertools.chain.from_iterable(values), dtype=np.int64, count=offsets[-1])
+            layout['columns'].append({'name': name, 'kind': 'list'})
+        elif values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            # sorted, so groupby and value_counts list the categories in the order they list strings
+            codes, categories = pd.factorize(values, sort=True)
+            arrays[f'{position}/codes'] = codes.astype(code_dtype(len(categories)))
+            layout['columns'].append({'name': name, 'kind': 'category', 'categories': categories.tolist()})
+        else:
+            arrays[f'{position}/values'] = values.values
+            layout['columns'].append({'name': name, 'kind': 'numeric'})
+    return layout, arrays
+
+def decode_frame(layout, get):
+    # Frame on the arrays returned by get(key); only the list columns and the small MultiIndex levels are copied
+    if layout['levels'] is not None:
+        codes = [get(f'index/codes/{i}') for i in range(len(layout['levels']))]
+        index = pd.MultiIndex(levels=layout['levels'], codes=codes, names=layout['index_names'], verify_integrity=False)
+    else:
+        index = pd.Index(get('index/values'), name=layout['index_names'][0], copy=False)
+    columns = {}
+    for position, column in enumerate(layout['columns']):
+        if column['kind'] == 'numeric':
+            values = get(f'{position}/values')
+        elif column['kind'] == 'category':
+            values = pd.Categorical.from_codes(get(f'{position}/codes'), categories=column['categories'])
+        else:
+            offsets, flat = get(f'{position}/offsets'), get(f'{position}/values')
+            values = np.empty(len(index), dtype=object)
+            for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+                values[i] = flat[start:end].tolist()
+        columns[column['name']] = values
+    return pd.DataFrame(columns, index=index, columns=[column['name'] for column in layout['columns']], copy=False)
+
+def encode_matching_data(matching_data):
+    layouts, arrays = {}, {}
+    for field in dataclasses.fields(matching_data):
+        df = getattr(matching_data, field.name)
+        if df is None:
+            continue
+        layouts[field.name], frame_arrays = encode_frame(df)
+        arrays.update({f'{field.name}/{key}': values for key, values in frame_arrays.items()})
+    return layouts, arrays
+
+def readonly(values):
+    values.flags.writeable = False
+    return values
+
+@dataclasses.dataclass
+class SharedMatchingData:
+    # Picklable handle of a MatchingData laid out in shared memory (name) or in a directory of .npy files
+    # (directory). Pass it to worker processes and call attach() in each of them.
+    layouts: dict
+    # array key -> (offset in the shared memory block, dtype, shape)
+    arrays: dict
+    name: str = None
+    directory: str = None
+
+    def attach(self):
+        # MatchingData whose frames are read-only views of the shared arrays. Frames derived from them (by
+        # query, join, ...) are ordinary private frames.
+        if self.directory is not None:
+            def get(key):
+                return np.load(os.path.join(self.directory, npy_name(key)), mmap_mode='r')
+        else:
+            buf = attach_block(self.name).buf
+            def get(key):
+                offset, dtype, shape = self.arrays[key]
+                return readonly(np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset))
+        frames = {name: decode_frame(layout, lambda key, name=name: get(f'{name}/{key}')) for name, layout in self.layouts.items()}
+        return MatchingData(**frames)
+
+    def unlink(self):
+        # Frees the shared memory block once no process needs it any more (called by the process that shared
+        # it). Processes still attached keep their mapping until they exit.
+        if self.name is not None:
+            block = _blocks.get(self.name) or shared_memory.SharedMemory(name=self.name)
+            block.unlink()
+
+def attach_block(name):
+    if name not in _blocks:
+        block = shared_memory.SharedMemory(name=name)
+        if multiprocessing.parent_process() is None:
+            # A process that did not inherit the resource tracker of the one that shared the block would
+            # otherwise unlink it when it exits
+            resource_tracker.unregister(block._name, 'shared_memory')
+        _blocks[name] = block
+    return _blocks[name]
+
+def npy_name(key):
+    return key.replace('/', '.') + '.npy'
+
+def share_matching_data(matching_data):
+    # Copies matching_data to one shared memory block, which lives until unlink() is called on the returned
+    # handle (or, failing that, until this process and its workers have exited)
+    layouts, arrays = encode_matching_data(matching_data)
+    specs, offset = {}, 0
+    for key, values in arrays.items():
+        specs[key] = (offset, values.dtype.str, values.shape)
+        offset += -(-values.nbytes // ALIGN_BYTES) * ALIGN_BYTES
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    _blocks[block.name] = block
+    for key, values in arrays.items():
+        start, dtype, shape = specs[key]
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)[...] = values
+    logger.info(f"Shared the matching data in {offset / 2**20:.1f} MB of shared memory {block.name}")
+    return SharedMatchingData(layouts=layouts, arrays=specs, name=block.name)
+
+def save_matching_data_columns(matching_data, directory):
+    # Writes matching_data as .npy columns to directory, for processes that are not started by this one
+    # (e.g. separate analysis scripts); they attach by memory mapping the files
+    layouts, arrays = encode_matching_data(matching_data)
+    os.makedirs(directory, exist_ok=True)
+    specs = {}
+    for key, values in arrays.items():
+        np.save(os.path.join(directory, npy_name(key)), values)
+        specs[key] = (0, values.dtype.str, values.shape)
+    shared = SharedMatchingData(layouts=layouts, arrays=specs, directory=directory)
+    pd.to_pickle(shared, os.path.join(directory, LAYOUT_FILE))
+    return shared
+
+def load_matching_data_columns(directory):
+    # Handle of the columns written by save_matching_data_columns
+    return pd.read_pickle(os.path.join(directory, LAYOUT_FILE))
@@ -0,0 +1,112 @@
+import argparse
+import json
+import logging
+import yaml
+import numpy as np
+import pandas as pd
+from base_ilp import COEF_DECIMALS
+from matching_data import get_data
+from column_generation import solve_relaxation, read_capacity_duals, price_columns, REDUCED_COST_TOL
+
+logger = logging.getLogger(__name__)
+
+def top_sum(groups, values, caps):
+    # Sum over groups of the (at most caps) largest positive values of each group
+    keep = values > 0
+    groups, values, caps = groups[keep], values[keep], caps[keep]
+    order = np.lexsort((-values, groups))
+    groups, values, caps = groups[order], values[order], caps[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    rank = np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)]))
+    return float(values[rank < caps].sum())
+
+def lagrangian_bounds(candidate_df, paper_duals, reviewer_duals, config):
+    # Two upper bounds on the hard constraint matching over all candidate pairs, from the capacity duals of
+    # the sparse LP. Each dualizes one family of capacity rows (y >= 0 for <= rows) and keeps the other: every
+    # (paper, role), resp. reviewer, then takes its capacity's worth of the best positive score - y. Dropping
+    # the fixed assignment rows only relaxes the problem further.
+    hyper_params = config['HYPER_PARAMS']
+    index = candidate_df.index
+    papers, reviewers = index.get_level_values('paper').values, index.get_level_values('reviewer').values
+    roles = candidate_df['role'].values
+    scores = np.round(candidate_df['score'].values, COEF_DECIMALS)
+    if hyper_params['relax_paper_capacity']:
+        paper_duals = paper_duals.clip(lower=0)
+    reviewer_duals = reviewer_duals.clip(lower=0)
+
+    positions = paper_duals.index.get_indexer(pd.MultiIndex.from_arrays([papers, roles]))
+    paper_dual = np.where(positions >= 0, paper_duals.values[np.maximum(positions, 0)] if len(paper_duals) else 0.0, 0.0)
+    reviewer_dual = reviewer_duals.reindex(reviewers).fillna(0.0).values
+    paper_caps = pd.Series(roles).map(lambda role: hyper_params[f'max_reviews_per_paper_{role}']).values
+    reviewer_caps = pd.Series(roles).map(lambda role: hyper_params[f'max_papers_per_reviewer_{role}']).values
+
+    reviewer_roles = pd.Series(roles, index=reviewers).groupby(level=0).first()
+    paper_rhs = paper_duals.index.get_level_values('role').map(lambda role: hyper_params[f'max_reviews_per_paper_{role}']).values
+    reviewer_rhs = reviewer_roles.reindex(reviewer_duals.index).map(lambda role: hyper_params[f'max_papers_per_reviewer_{role}']).values
+    keep_papers = np.dot(reviewer_duals.values, reviewer_rhs) + top_sum(pd.factorize(pd.MultiIndex.from_arrays([papers, roles]))[0], scores - reviewer_dual, paper_caps)
+    keep_reviewers = np.dot(paper_duals.values, paper_rhs) + top_sum(pd.factorize(reviewers)[0], scores - paper_dual, reviewer_caps)
+    return float(keep_papers), float(keep_reviewers)
+
+def certify_sparsification(paper_reviewer_df, reviewer_df, distance_df, candidate_df, config, output_files_prefix, backend='cplex', fixed_variable_solution_file=None):
+    # Bounds the hard constraint objective lost by sparsifying candidate_df down to paper_reviewer_df. The LP
+    # over the sparse pairs is solved; the matching over all candidate pairs (whose LP is integral, the
+    # constraint matrix being totally unimodular) is worth at most the smallest of
+    #  - the dual bound: the sparse optimum plus the positive reduced costs of the excluded pairs (the sparse
+    #    duals, with a bound dual max(0, reduced cost) per excluded pair, are dual feasible for the full LP)
+    #  - the two lagrangian_bounds
+    # Writes {output_files_prefix}_certificate.json and returns its contents.
+    solution_file, objective = solve_relaxation(paper_reviewer_df, reviewer_df, distance_df, config, output_files_prefix,
+                                                backend=backend, fixed_variable_solution_file=fixed_variable_solution_file)
+    paper_duals, reviewer_duals = read_capacity_duals(solution_file)
+    excluded, reduced_costs = price_columns(candidate_df, paper_reviewer_df, paper_duals, reviewer_duals)
+    bounds = {'dual': objective + float(np.maximum(reduced_costs, 0).sum())}
+    bounds['keep_paper_capacity'], bounds['keep_reviewer_capacity'] = lagrangian_bounds(candidate_df, paper_duals, reviewer_duals, config)
+    best = min(bounds, key=bounds.get)
+    # the sparse optimum is itself a lower bound on the full one
+    gap = max(bounds[best] - objective, 0.0)
+
+    certificate = {
+        'sparse_objective': objective,
+        'upper_bound': objective + gap,
+        'gap': gap,
+        'relative_gap': gap / abs(objective) if objective != 0 else float('inf'),
+        'bound': best,
+        'bounds': bounds,
+        'pairs': len(paper_reviewer_df),
+        'excluded_pairs': len(excluded),
+        'excluded_pairs_pricing_out': int(np.sum(reduced_costs > REDUCED_COST_TOL)),
+    }
+    logger.info(f"Sparse optimum {objective:.3f}, at most {gap:.3f} ({100 * certificate['relative_gap']:.4f}%) below the optimum over all "
+                f"{len(paper_reviewer_df) + len(excluded)} candidate pairs ({best} bound); "
+                f"{certificate['excluded_pairs_pricing_out']} excluded pairs have a positive reduced cost")
+    with open(output_files_prefix + '_certificate.json', 'w') as fh:
+        json.dump(certificate, fh, indent=1)
+    return certificate
+
+def main(output_files_prefix, config, backend='cplex', rebuild_scores_file=False, fixed_variable_solution_file=None):
+    matching_data = get_data(config=config, rebuild_scores_file=rebuild_scores_file, keep_candidates=True)
+    return certify_sparsification(matching_data.paper_reviewer_df, matching_data.reviewer_df, matching_data.distance_df,
+                                  matching_data.candidate_df, config, output_files_prefix, backend=backend,
+                                  fixed_variable_solution_file=fixed_variable_solution_file)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_files_prefix', type=str, default='certificate')
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--sparsity_k', type=int, default=None, help='certify this sparsity_k instead of the one in the config')
+    parser.add_argument('--solver', type=str, default='cplex', choices=['cplex', 'highs'])
+    parser.add_argument('--rebuild_scores_file', action='store_true')
+    parser.add_argument('--fixed_variable_solution_file', type=str, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.config_file, 'rb') as fh:
+        config = yaml.load(fh,Loader=yaml.FullLoader)
+    if args.sparsity_k is not None:
+        config['HYPER_PARAMS']['sparsity_k'] = args.sparsity_k
+
+    main(output_files_prefix=args.output_files_prefix,
+        config=config,
+        backend=args.solver,
+        rebuild_scores_file=args.rebuild_scores_file,
+        fixed_variable_solution_file=args.fixed_variable_solution_file)
@@ -0,0 +1,156 @@
+import argparse
+import copy
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+import pandas as pd
+import yaml
+import lp_solver
+import iter_solve
+from analyze_sol import solution_metrics
+from data_cache import DATA_HYPER_PARAMS
+from matching_data import get_data
+from shared_matching_data import share_matching_data
+
+logger = logging.getLogger(__name__)
+
+# Data shared by the scenarios of a worker, set by init_worker
+_matching_data = None
+
+def load_scenarios(sweep_file):
+    # A sweep file holds a GRID of HYPER_PARAMS overrides, each mapped to the list of values to try (every
+    # combination is a scenario), and/or a list of explicit SCENARIOS (each a dict of overrides), e.g.
+    #     GRID:
+    #         region_reward: [0.0, 0.1, 0.2]
+    #         coreview_dis0_pen: [-0.3, -1.0]
+    #     SCENARIOS:
+    #         - {sen_reward: 0.0, paper_distribution_pen: {AC: {20: -0.1}, SPC: {8: -0.1}}}
+    with open(sweep_file, 'rb') as fh:
+        sweep = yaml.load(fh, Loader=yaml.FullLoader)
+    scenarios = [dict(overrides) for overrides in sweep.get('SCENARIOS') or []]
+    grid = sweep.get('GRID') or {}
+    for values in itertools.product(*grid.values()):
+        scenarios.append(dict(zip(grid.keys(), values)))
+    if not scenarios:
+        raise ValueError(f"{sweep_file} defines no scenarios, expected a GRID and/or SCENARIOS")
+    return scenarios
+
+def scenario_config(config, overrides):
+    # The data is prepared once for all scenarios, so they may only differ in the model parameters
+    data_params = set(overrides) & set(DATA_HYPER_PARAMS)
+    if data_params:
+        raise ValueError(f"Scenarios cannot change {sorted(data_params)}: the data is prepared once for the whole sweep")
+    unknown = set(overrides) - set(config['HYPER_PARAMS'])
+    if unknown:
+        raise ValueError(f"Unknown hyper parameters {sorted(unknown)}")
+    config = copy.deepcopy(config)
+    config['HYPER_PARAMS'].update(overrides)
+    return config
+
+def format_param(value):
+    # nested parameters (e.g. paper_distribution_pen) fill one cell of the comparison table
+    return str(value) if isinstance(value, (dict, list)) else value
+
+def init_worker(shared_data, threads):
+    # Every worker attaches to the frames the parent put in shared memory instead of holding its own copy
+    global _matching_data
+    _matching_data = shared_data.attach()
+    lp_solver.set_default_threads(threads)
+
+def run_scenario(index, overrides, config, output_files_prefix, solve_kwargs):
+    prefix = f'{output_files_prefix}_scenario_{index}'
+    record = {'scenario': index, 'output_files_prefix': prefix}
+    record.update({key: format_param(value) for key, value in overrides.items()})
+    start_time = time.time()
+    try:
+        result = iter_solve.main(output_files_prefix=prefix, config=scenario_config(config, overrides),
+                                 matching_data=_matching_data, **solve_kwargs)
+        record.update({
+            'status': result.status['status'],
+            'objective': result.status['objective'],
+            'full_objective': result.status['full_objective'],
+            'iterations': result.iterations,
+            'last_solve_time': result.status['time'],
+        })
+        record.update(solution_metrics(result.parsed_solution, result.violation_df, _matching_data.reviewer_df))
+    except Exception:
+        logger.error(f"Scenario {index} ({overrides}) failed:\n{traceback.format_exc()}")
+        record['status'] = 'failed'
+    record['runtime'] = time.time() - start_time
+    return record
+
+def main(output_files_prefix, config, sweep_file, workers=None, threads=1, rebuild_scores_file=False, **solve_kwargs):
+    # Runs iter_solve.main for every scenario of sweep_file (each with the files {output_files_prefix}_scenario_{i}),
+    # workers at a time, on data prepared once. threads caps the solver threads of each worker, so
+    # workers * threads should not exceed the cores. Writes {output_files_prefix}_sweep.csv, one row per
+    # scenario with its overrides, objective, runtime and solution_metrics, and returns it as a DataFrame.
+    scenarios = load_scenarios(sweep_file)
+    for overrides in scenarios:
+        scenario_config(config, overrides)
+    workers = workers or max(1, (os.cpu_count() or 1) // max(threads, 1))
+    workers = min(workers, len(scenarios))
+
+    logger.info("Preparing the data shared by all scenarios...")
+    matching_data = get_data(config=config, rebuild_scores_file=rebuild_scores_file, keep_candidates=solve_kwargs.get('column_generation', False))
+
+    logger.info(f"Running {len(scenarios)} scenarios on {workers} workers with {threads} solver threads each")
+    shared_data = share_matching_data(matching_data)
+    del matching_data
+    try:
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(shared_data, threads)) as pool:
+            jobs = [pool.apply_async(run_scenario, (i, overrides, config, output_files_prefix, solve_kwargs)) for i, overrides in enumerate(scenarios)]
+            records = [job.get() for job in jobs]
+    finally:
+        shared_data.unlink()
+
+    results = pd.DataFrame.from_records(records).set_index('scenario')
+    # a parameter left out of a scenario keeps its value from config
+    for key in set().union(*scenarios):
+        value = config['HYPER_PARAMS'][key]
+        results[key] = results[key].fillna(format_param(value))
+    results_file = f'{output_files_prefix}_sweep.csv'
+    results.to_csv(results_file)
+    logger.info(f"Wrote the comparison of {len(results)} scenarios to {results_file}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output_files_prefix', type=str, default='sweep')
+    parser.add_argument('--config_file', type=str, default='config.yml')
+    parser.add_argument('--sweep_file', type=str, required=True, help='yml with the GRID and/or SCENARIOS of hyper parameter overrides')
+    parser.add_argument('--workers', type=int, default=None, help='scenarios solved in parallel (default: cores / threads)')
+    parser.add_argument('--threads', type=int, default=1, help='solver threads per worker')
+    parser.add_argument('--rebuild_scores_file', action='store_true')
+    parser.add_argument('--fixed_variable_solution_file', type=str, default=None)
+    parser.add_argument('--add_soft_constraints', action='store_true')
+    parser.add_argument('--max_iter', type=int, default=10000000)
+    parser.add_argument('--in_memory', action='store_true')
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--lazy', action='store_true')
+    parser.add_argument('--solver', type=str, default='cplex', choices=['cplex', 'highs'])
+    parser.add_argument('--abstol', type=float, default=None)
+    parser.add_argument('--relative_mip_gap', type=float, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.config_file, 'rb') as fh:
+        config = yaml.load(fh, Loader=yaml.FullLoader)
+
+    main(output_files_prefix=args.output_files_prefix,
+        config=config,
+        sweep_file=args.sweep_file,
+        workers=args.workers,
+        threads=args.threads,
+        rebuild_scores_file=args.rebuild_scores_file,
+        fixed_variable_solution_file=args.fixed_variable_solution_file,
+        add_soft_constraints=args.add_soft_constraints,
+        max_iter=args.max_iter,
+        in_memory=args.in_memory,
+        incremental=args.incremental,
+        lazy=args.lazy,
+        solver=args.solver,
+        abstol=args.abstol,
+        relative_mip_gap=args.relative_mip_gap)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from compute_scores import get_scores, BID_RUBRIC
+from benchmarks.legacy_scores import legacy_get_scores
+
+POSITIVE_BID_THR = 4
+
+def make_config():
+    return {
+        'POSITIVE_BID_THR': POSITIVE_BID_THR,
+        'HYPER_PARAMS': {'bid_inverse_exponents': [0.05, 1, 1.5, 2.5, 4]},
+    }
+
+def make_scores(ntpms, nacl, nk, bid):
+    n = len(bid)
+    return pd.DataFrame({'paper': np.arange(n), 'reviewer': np.arange(n) % 7, 'ntpms': ntpms, 'nacl': nacl, 'nk': nk,
+                         'bid': np.asarray(bid, dtype=np.float64)}).set_index(['paper', 'reviewer'])
+
+def assert_same_scores(expected, actual):
+    # NaN in the same places and the same bits everywhere else (the sign and payload of a NaN depend on the
+    # operation that produced it and carry no information)
+    assert expected.index.equals(actual.index)
+    a, b = expected['score'].values, actual['score'].values
+    nan = np.isnan(a)
+    np.testing.assert_array_equal(nan, np.isnan(b))
+    np.testing.assert_array_equal(a[~nan].view(np.int64), b[~nan].view(np.int64))
+
+def check_against_legacy(scores):
+    config = make_config()
+    before = scores.copy()
+    new = get_scores(config, scores)
+    pd.testing.assert_frame_equal(scores, before)
+    assert list(new.columns) == ['score']
+    assert_same_scores(legacy_get_scores(config, scores.copy()), new)
+
+def test_random_scores():
+    rng = np.random.default_rng(0)
+    n = 20000
+    values = []
+    for _ in range(3):
+        column = rng.normal(0.4, 0.3, n)
+        column[rng.random(n) < 0.05] = 0.0
+        column[rng.random(n) < 0.2] = np.nan
+        values.append(column)
+    check_against_legacy(make_scores(*values, rng.choice(BID_RUBRIC, n)))
+
+def test_every_nan_pattern():
+    # every combination of missing ntpms, nacl and nk, for every bid of the rubric
+    patterns = np.array(np.meshgrid([0, 1], [0, 1], [0, 1], np.arange(len(BID_RUBRIC)))).reshape(4, -1)
+    ntpms = np.where(patterns[0] == 1, np.nan, 0.6)
+    nacl = np.where(patterns[1] == 1, np.nan, 0.3)
+    nk = np.where(patterns[2] == 1, np.nan, 0.1)
+    check_against_legacy(make_scores(ntpms, nacl, nk, BID_RUBRIC[patterns[3]]))
+
+@pytest.mark.parametrize('bid', [0.0, 0.5, 1.5, 3, 5, 7, -1])
+def test_off_rubric_bids(bid):
+    n = 4
+    check_against_legacy(make_scores([0.6, np.nan, 1.0, 0.01], [0.2, 0.3, 1.0, np.nan], [0.5, 0.05, np.nan, 0.02], [bid] * n))
+
+def test_bids_at_positive_threshold():
+    # at POSITIVE_BID_THR a bid is positive, so a keyword score below epsilon is replaced by the match score
+    bids = [POSITIVE_BID_THR - 1e-9, POSITIVE_BID_THR, POSITIVE_BID_THR, POSITIVE_BID_THR + 2]
+    scores = make_scores([0.5, 0.5, 0.5, 0.5], [0.3, 0.3, np.nan, 0.3], [0.0, 0.0, 1e-8, 0.0], bids)
+    check_against_legacy(scores)
+    new = get_scores(make_config(), scores)['score'].values
+    assert new[1] == 0.4 ** (1 / 2.5)
+    assert new[2] == 0.5 ** (1 / 2.5)
@@ -0,0 +1,73 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pytest
+from matching_data import MatchingData
+from shared_matching_data import attach_block, share_matching_data, save_matching_data_columns, load_matching_data_columns
+
+def make_matching_data():
+    reviewer_df = pd.DataFrame({
+        'reviewer': [3, 1, 7, 4],
+        'role': ['PC', 'AC', 'SPC', 'PC'],
+        'seniority': [0, 3, 2, 1],
+        'conflict_papers': [[10], [], [11, 12], []],
+        'authored': [[], [12], [], [10, 11]],
+        'region': ['Region1', 'Region0', np.nan, 'Region1'],
+        'authored_any': [False, True, False, True],
+    }).set_index('reviewer')
+    paper_reviewer_df = pd.DataFrame({
+        'paper': [12, 10, 11, 12, 10],
+        'reviewer': [3, 1, 7, 4, 4],
+        'score': [0.5, 0.25, np.nan, 1.0, 0.75],
+        'role': ['PC', 'AC', 'SPC', 'PC', 'PC'],
+        'bid': [1.0, 6.0, 4.0, 0.05, 2.0],
+    }).set_index(['paper', 'reviewer'])
+    distance_df = pd.DataFrame({'reviewer_1': [1, 3], 'reviewer_2': [4, 7], 'distance': [0, 1]}).set_index(['reviewer_1', 'reviewer_2'])
+    return MatchingData(reviewer_df=reviewer_df, paper_reviewer_df=paper_reviewer_df, distance_df=distance_df)
+
+def as_strings(df):
+    # attached string columns are categoricals
+    return df.astype({name: object for name, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)})
+
+def assert_same_data(expected, attached):
+    for name in ['reviewer_df', 'paper_reviewer_df', 'distance_df']:
+        pd.testing.assert_frame_equal(as_strings(getattr(attached, name)), getattr(expected, name))
+    assert attached.candidate_df is None and attached.candidate_reviewer_df is None
+
+def attach_in_worker(shared):
+    matching_data = shared.attach()
+    # frames come back by value, so the parent can compare them
+    return MatchingData(**{name: getattr(matching_data, name) for name in ['reviewer_df', 'paper_reviewer_df', 'distance_df']})
+
+@pytest.mark.parametrize('method', ['spawn', 'fork'])
+def test_round_trip_between_processes(method):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f'no {method} start method')
+    matching_data = make_matching_data()
+    shared = share_matching_data(matching_data)
+    try:
+        with multiprocessing.get_context(method).Pool(2) as pool:
+            for attached in pool.map(attach_in_worker, [shared, shared]):
+                assert_same_data(matching_data, attached)
+    finally:
+        shared.unlink()
+
+def test_attach_is_zero_copy_and_read_only():
+    shared = share_matching_data(make_matching_data())
+    try:
+        attached = shared.attach()
+        df = attached.paper_reviewer_df
+        block = np.frombuffer(attach_block(shared.name).buf, dtype=np.uint8)
+        for values in [df['score'].values, df['role'].values.codes, df.index.codes[0]]:
+            assert np.shares_memory(values, block)
+            assert not values.flags.writeable
+        del block
+        with pytest.raises(ValueError):
+            df['score'].values[0] = 0
+    finally:
+        shared.unlink()
+
+def test_npy_columns_round_trip(tmp_path):
+    matching_data = make_matching_data()
+    save_matching_data_columns(matching_data, str(tmp_path / 'columns'))
+    assert_same_data(matching_data, load_matching_data_columns(str(tmp_path / 'columns')).attach())